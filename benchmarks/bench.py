@@ -0,0 +1,233 @@
+"""Benchmark the packing engine, density and I/O hot paths.
+
+Times each operation on synthetic populations of regular polygons, varying the
+number of polygons N, their number of vertices and the packing fraction, and
+records the wall time (best of several repeated samples) and the peak memory traced by
+tracemalloc (NumPy allocations, but not those inside GEOS).
+
+Results are written as JSON. Each benchmark is compared against a stored baseline
+(an earlier results file, by default benchmarks/baseline.json if it exists) and
+regressions are reported, in which case the exit status is 1.
+
+    python benchmarks/bench.py --quick --save-baseline    # store a baseline
+    python benchmarks/bench.py --quick --output results.json  # compare with it
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from shapely.geometry import box
+
+from polypacker import PolyPacker, overlap, read_polygons, write_polygons
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+# ============================== #
+#           Population           #
+# ============================== #
+
+def make_population(N, vertices, fraction, seed=0):
+    """Create N regular polygons with the given number of vertices.
+    Their (randomly rotated and scaled) shapes are placed uniformly at random in a
+    square region, sized such that the total area of the polygons is the given
+    fraction of the region's area. Returns the vertex buffer and the region.
+    """
+    rng = np.random.default_rng(seed)
+    radii = rng.uniform(0.5, 1.5, N)
+    angles = 2*np.pi*(np.arange(vertices)/vertices + rng.uniform(0, 1, (N, 1)))
+    xy = np.stack([np.cos(angles), np.sin(angles)], axis=-1) * radii[:, np.newaxis, np.newaxis]
+    area = np.sum(vertices/2*np.sin(2*np.pi/vertices)*radii**2)
+    half = np.sqrt(area/fraction)/2
+    xy += rng.uniform(-half, half, (N, 1, 2))
+    offsets = np.arange(N+1)*vertices
+    return xy.reshape((-1, 2)), offsets, box(-half, -half, half, half)
+
+
+# ============================== #
+#           Benchmarks           #
+# ============================== #
+
+# each benchmark takes the population and a scratch directory, and returns the function to time
+
+def bench_add_polygons(population, directory):
+    vertices, offsets, _ = population
+    polygons = [vertices[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+    return lambda: PolyPacker().add_polygons(polygons)
+
+
+def bench_add_vertices(population, directory):
+    vertices, offsets, _ = population
+    return lambda: PolyPacker().add_vertices(vertices, offsets)
+
+
+def bench_find_intersections(population, directory):
+    packer = make_packer(population)
+    return lambda: packer.find_intersections(sparse=True)  # dense is O(N^2) memory
+
+
+def bench_step(population, directory):
+    packer = make_packer(population)
+    return lambda: packer.step(0.01, 0.01)
+
+
+def bench_overlap(population, directory):
+    packer = make_packer(population)
+    polygons = packer.get_polygons('global')
+    return lambda: overlap(polygons, population[2], rel_abs='rel')
+
+
+def bench_write_polygons(population, directory, binary):
+    packer = make_packer(population)
+    polygons = packer.get_polygons('global')
+    filepath = os.path.join(directory, 'write.vtk')
+    return lambda: write_polygons(filepath, polygons, binary=binary)
+
+
+def bench_read_polygons(population, directory, binary):
+    packer = make_packer(population)
+    filepath = os.path.join(directory, 'read.vtk')
+    write_polygons(filepath, packer.get_vertices('global'), binary=binary)
+    return lambda: read_polygons(filepath)
+
+
+def make_packer(population):
+    packer = PolyPacker()
+    packer.add_vertices(*population[:2])
+    return packer
+
+
+BENCHMARKS = {
+    'add_polygons': bench_add_polygons,
+    'add_vertices': bench_add_vertices,
+    'find_intersections': bench_find_intersections,
+    'step': bench_step,
+    'overlap': bench_overlap,
+    'write_polygons_ascii': lambda p, d: bench_write_polygons(p, d, binary=False),
+    'write_polygons_binary': lambda p, d: bench_write_polygons(p, d, binary=True),
+    'read_polygons_ascii': lambda p, d: bench_read_polygons(p, d, binary=False),
+    'read_polygons_binary': lambda p, d: bench_read_polygons(p, d, binary=True),
+}
+
+
+def measure(func, repeat, min_sample=0.05):
+    """Return the best wall time and the peak traced memory of func().
+    Each of the repeat samples calls func often enough to take at least min_sample
+    seconds (like timeit), so that short benchmarks are not dominated by noise.
+    """
+    start = time.perf_counter()
+    func()
+    number = max(1, int(np.ceil(min_sample/max(time.perf_counter()-start, 1e-9))))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter()-start)/number)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def run(sizes, vertices, fractions, names, repeat, max_work):
+    """Run all benchmarks and return the list of results.
+    Files are written to a temporary directory, which is removed afterwards.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for N in sizes:
+            for k in vertices:
+                if N*k > max_work:
+                    continue  # skip the largest problems
+                for fraction in fractions:
+                    population = make_population(N, k, fraction)
+                    for name in names:
+                        func = BENCHMARKS[name](population, directory)
+                        wall, peak = measure(func, repeat if N*k < max_work/10 else 1)
+                        result = dict(name=name, N=N, vertices=k, fraction=fraction, time=wall, peak_memory=peak)
+                        results.append(result)
+                        print('%-22s N=%-7d vertices=%-3d fraction=%.2f  %10.4f s  %10.1f MiB'
+                              % (name, N, k, fraction, wall, peak/2**20))
+    return results
+
+
+# ============================== #
+#            Baseline            #
+# ============================== #
+
+def key(result):
+    return result['name'], result['N'], result['vertices'], result['fraction']
+
+
+def compare(results, baseline, threshold, min_time):
+    """Compare results with a baseline, return the regressions (time or memory ratio > threshold).
+    Times only regress if they are also slower by at least min_time (in seconds), as the
+    shortest benchmarks vary by more than the threshold from run to run.
+    """
+    reference = {key(r): r for r in baseline['results']}
+    regressions = []
+    print('\n%-22s %7s %4s %5s  %8s  %8s' % ('benchmark', 'N', 'vert', 'frac', 'time', 'memory'))
+    for result in results:
+        ref = reference.get(key(result))
+        if ref is None:
+            continue
+        t_ratio = result['time']/max(ref['time'], 1e-9)
+        m_ratio = result['peak_memory']/max(ref['peak_memory'], 1)
+        slower = t_ratio > threshold and result['time']-ref['time'] >= min_time
+        flag = ' <-- REGRESSION' if slower or m_ratio > threshold else ''
+        if flag:
+            regressions.append(dict(result, time_ratio=t_ratio, memory_ratio=m_ratio))
+        print('%-22s %7d %4d %5.2f  %7.2fx  %7.2fx%s' % (*key(result), t_ratio, m_ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--vertices', type=int, nargs='+', default=[3, 8, 64])
+    parser.add_argument('--fractions', type=float, nargs='+', default=[0.3, 0.6])
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=5, help='best of this many runs')
+    parser.add_argument('--max-work', type=int, default=10**7, help='skip if N*vertices exceeds this')
+    parser.add_argument('--quick', action='store_true', help='small problems only')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=BASELINE, help='compare with the results in this JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=1.25, help='ratio flagged as regression')
+    parser.add_argument('--min-time', type=float, default=0.005, help='time difference (s) needed for a regression')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes, args.vertices, args.fractions = [100, 1000], [3, 8], [0.5]
+
+    results = run(args.sizes, args.vertices, args.fractions, args.benchmarks, args.repeat, args.max_work)
+    report = dict(machine=dict(python=sys.version.split()[0], platform=platform.platform(),
+                               processor=platform.processor(), numpy=np.__version__),
+                  results=results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        if regressions:
+            print('\n%d regression(s) beyond %.2fx' % (len(regressions), args.threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
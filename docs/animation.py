@@ -1,9 +1,11 @@
 """Animate packing process."""
 
+import tempfile
+
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 
-from polypacker import PolyPacker, plot_polygons
+from polypacker import PolyPacker, TrajectoryReader, TrajectoryWriter, plot_polygons
 from polypacker.visualize import update_patch
 
 from demo import make_polys  # ./demo.py
@@ -11,27 +13,31 @@ from demo import make_polys  # ./demo.py
 
 Nframes = 180
 
-def packing():
+def packing(trajectory):
+    """Record the packing into the (empty) directory trajectory."""
 
     polygons0 = make_polys()
     packer = PolyPacker()
     packer.add_polygons(polygons0)
 
     att, rep = 0.01, 0.05
-    polygons = []
-    for _ in range(Nframes):
-        packer.step(att, rep)
-        polygons.append(packer.get_polygons('global'))
+    with TrajectoryWriter(trajectory, packer) as writer:
+        for _ in range(Nframes):
+            packer.step(att, rep)
+            writer.append(packer.centers)
 
-    return polygons
+    return TrajectoryReader(trajectory)
 
 
 def anim():
+    with tempfile.TemporaryDirectory() as trajectory:  # a fresh recording on every run
+        _anim(packing(trajectory))
+
 
-    polygons = packing()
+def _anim(frames):
 
     fig, ax = plt.subplots()
-    patches = plot_polygons(polygons[0], axis=ax)
+    patches = plot_polygons(frames[0].get_polygons(), axis=ax)
 
     def init():
         ax.set_xlim(-2, +2)
@@ -40,7 +46,8 @@ def anim():
         return patches
 
     def update(frame):
-        return [update_patch(patch, poly) for poly, patch in zip(polygons[frame], patches)]
+        polygons = frames[frame].get_polygons()  # loaded lazily
+        return [update_patch(patch, poly) for poly, patch in zip(polygons, patches)]
 
     ani = FuncAnimation(fig, update, frames=Nframes, init_func=init, blit=True)
     ani.save('animation.mp4', fps=30, dpi=300)
@@ -1,4 +1,4 @@
-from .packing import PolyPacker, overlap, update
+from .packing import PolyPacker, Ensemble, ParallelExecutor, DomainPacker, DensityMonitor, Stats, overlap, update
 from .visualize import plot_polygon, plot_polygons
-from .ui import CLI, GUI, uipicker
-from .io import read_polygons, write_polygons
+from .ui import CLI, GUI, Simulation, uipicker
+from .io import read_polygons, write_polygons, TrajectoryReader, TrajectoryWriter
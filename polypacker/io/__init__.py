@@ -1 +1,2 @@
 from .vtk import read_polygons, write_polygons
+from .trajectory import TrajectoryReader, TrajectoryWriter
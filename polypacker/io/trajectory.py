@@ -0,0 +1,150 @@
+import glob
+import os
+
+import numpy as np
+
+from ..packing.geometry import rotated, translated, unragged
+
+
+SHAPES_FILE = 'shapes.npz'
+CHUNK_FILE = 'centers_%06d.npy'
+ANGLES_FILE = 'angles_%06d.npy'
+
+
+class TrajectoryWriter:
+    """Record the positions of a packing run to a directory on disk.
+    The shapes (local vertex buffer) are stored once, the centres of each frame are
+    collected in a chunk of frames in memory, which is written to its own .npy file
+    when full. Memory use is thus independent of the number of frames.
+    If the packer rotates its polygons (see PolyPacker.rotate), the angles of each
+    frame (relative to the stored shapes) are recorded as well.
+    Use as a context manager or call close() to write the last (partial) chunk.
+    """
+
+    def __init__(self, dirpath, packer, chunk=256, dtype=float):
+        """Start a trajectory in dirpath (created if needed) for the polygons of the packer.
+        The centres are stored as dtype (e.g. float32 to halve the size).
+        """
+        os.makedirs(dirpath, exist_ok=True)
+        if glob.glob(os.path.join(dirpath, CHUNK_FILE.replace('%06d', '*'))):
+            raise Exception('directory already contains a trajectory: %s' % dirpath)
+        vertices, offsets = packer.get_vertices('local')
+        np.savez(os.path.join(dirpath, SHAPES_FILE), vertices=vertices, offsets=offsets)
+        self.dirpath = dirpath
+        self.N = packer.N
+        self._buffer = np.empty((chunk, self.N, 2), dtype=dtype)
+        if packer.orientations:
+            self._angles0 = packer.angles.copy()  # of the stored shapes
+            self._angles = np.empty((chunk, self.N), dtype=dtype)
+        else:
+            self._angles = None
+        self._count = 0  # frames in the buffer
+        self._chunks = 0  # chunks written
+        self.frames = 0  # frames recorded
+
+    def append(self, centers, angles=None):
+        """Record a frame with the centres (N, 2), e.g. packer.centers.
+        For rotating polygons, also pass their angles (N,), e.g. packer.angles.
+        """
+        if len(centers) != self.N:
+            raise Exception('expected %d centres, got %d' % (self.N, len(centers)))
+        if self._angles is not None:
+            if angles is None:
+                raise Exception('the polygons rotate, so angles are needed')
+            self._angles[self._count] = angles - self._angles0
+        self._buffer[self._count] = centers
+        self._count += 1
+        self.frames += 1
+        if self._count == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        """Write the frames in the buffer to a new chunk file."""
+        if self._count == 0:
+            return
+        np.save(os.path.join(self.dirpath, CHUNK_FILE % self._chunks), self._buffer[:self._count])
+        if self._angles is not None:
+            np.save(os.path.join(self.dirpath, ANGLES_FILE % self._chunks), self._angles[:self._count])
+        self._chunks += 1
+        self._count = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader:
+    """Read a trajectory recorded by TrajectoryWriter.
+    Frames are loaded lazily (the chunk files are memory-mapped), with random access
+    by index, e.g. reader[0] or reader[-1], and iteration over all frames.
+    """
+
+    def __init__(self, dirpath):
+        shapes = np.load(os.path.join(dirpath, SHAPES_FILE))
+        self.vertices, self.offsets = shapes['vertices'], shapes['offsets']
+        self.N = len(self.offsets)-1
+        files = sorted(glob.glob(os.path.join(dirpath, CHUNK_FILE.replace('%06d', '*'))))
+        self._chunks = [np.load(f, mmap_mode='r') for f in files]
+        files = sorted(glob.glob(os.path.join(dirpath, ANGLES_FILE.replace('%06d', '*'))))
+        self._angle_chunks = [np.load(f, mmap_mode='r') for f in files] or None
+        self._starts = np.cumsum([0]+[len(c) for c in self._chunks])  # first frame of each chunk
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('frame index out of range')
+        return Frame(self, idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def centers(self, idx):
+        """Load the centres (N, 2) of frame idx."""
+        k = np.searchsorted(self._starts, idx, side='right')-1
+        return np.array(self._chunks[k][idx-self._starts[k]])
+
+    def angles(self, idx):
+        """Load the angles (N,) of frame idx relative to the shapes (None if not rotating)."""
+        if self._angle_chunks is None:
+            return None
+        k = np.searchsorted(self._starts, idx, side='right')-1
+        return np.array(self._angle_chunks[k][idx-self._starts[k]])
+
+
+class Frame:
+    """A single frame of a trajectory, whose data is only loaded when needed."""
+
+    def __init__(self, reader, idx):
+        self.reader = reader
+        self.index = idx
+
+    @property
+    def centers(self):
+        return self.reader.centers(self.index)
+
+    def get_vertices(self, FoR='global'):
+        """Get the vertex buffer (vertices, offsets), see PolyPacker.get_vertices."""
+        vertices, offsets = self.reader.vertices, self.reader.offsets
+        angles = self.reader.angles(self.index)
+        if angles is not None:
+            vertices = rotated(vertices, offsets, angles)
+        if FoR == 'global':
+            return translated(vertices, offsets, self.centers), offsets
+        elif FoR == 'local':
+            return vertices, offsets
+        else:
+            raise Exception('invalid frame of reference (FoR)')
+
+    def get_polygons(self, FoR='global'):
+        """Get the polygons (a list of shapely.geometry.Polygon)."""
+        return list(unragged(*self.get_vertices(FoR=FoR)))
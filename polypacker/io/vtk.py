@@ -1,71 +1,125 @@
+import base64
+import lzma
 import os.path
+import re
+import xml.etree.ElementTree as ET
+import zlib
 
 import numpy as np
-from shapely.geometry import Polygon
-
-
-def write_polygons(filepath, polygons, polydata=None, comment='Polygons', binary=False):
-    """Create a (legacy) VTK file with polygons."""
-    extension = ".vtk"  # needs the period
-    if os.path.splitext(filepath)[1] != extension:
-        filepath += extension
-    with open(filepath, 'w') as vtk_file:
-        vtk_file.write('# vtk DataFile Version 2.0\n')
-        vtk_file.write('%s\n' % comment)
-        vtk_file.write('%s\n' % ('BINARY' if binary else 'ASCII'))
+
+from ..packing.geometry import as_vertices, periodic_clip, unragged
+
+
+def write_polygons(filepath, polygons, polydata=None, comment='Polygons', binary=False, box=None):
+    """Create a VTK file with polygons.
+    Writes XML PolyData if filepath ends with .vtp (binary: appended raw data),
+    otherwise a legacy VTK file (binary: big-endian data), appending .vtk if needed.
+    The polygons are either a list of shapely.geometry.Polygon objects or a vertex
+    buffer tuple (vertices, offsets), see packing.geometry.ragged.
+    The polydata is an array (N,) or (N, dim) of cell data, or a dict with its name
+    and data (as returned by read_polygons).
+    With box (Lx, Ly), the polygons are clipped to the periodic box centred at the origin
+    (see packing.geometry.periodic_clip), which gives a tileable substrate. Polygons that
+    cross a face are written as several parts, each with the polydata of its polygon.
+    Without box, the polygons are written as they are, e.g. wrapped into a periodic box.
+    """
+    if box is not None:
+        vertices, offsets, owner = periodic_clip(*as_vertices(polygons), np.asarray(box, dtype=float))
+        polygons = (vertices, offsets)
+        if polydata is not None:
+            name, data = as_celldata(polydata)
+            polydata = dict(name=name, data=data[owner])
+    extension = os.path.splitext(filepath)[1]
+    if extension == '.vtp':
+        with open(filepath, 'wb') as vtp_file:
+            add_polygons_to_vtp(vtp_file, polygons, celldata=polydata, binary=binary)
+        return
+    if extension != ".vtk":  # needs the period
+        filepath += ".vtk"
+    with open(filepath, 'wb') as vtk_file:
+        vtk_file.write(b'# vtk DataFile Version 2.0\n')
+        vtk_file.write(b'%s\n' % comment.encode())
+        vtk_file.write(b'%s\n' % (b'BINARY' if binary else b'ASCII'))
         add_polygons_to_vtk(vtk_file, polygons, celldata=polydata, binary=binary)
 
 
-def add_polygons_to_vtk(vtk_file, polygons, celldata=None, binary=False):
+def as_celldata(celldata):
+    """Return the name and the data (N, dim) of cell data (see write_polygons)."""
+    if isinstance(celldata, dict):
+        name = celldata.get('name', 'celldata')
+        dat = np.asarray(celldata['data'])  # should be 1D or 2D data
+    else:
+        name = 'celldata'
+        dat = np.asarray(celldata)
+    dat = dat[:, np.newaxis] if dat.ndim == 1 else dat
+    return name, dat
 
-    if binary:
-        raise NotImplementedError('cannot write binary files yet')
+
+# ============================== #
+#           Legacy VTK           #
+# ============================== #
+
+# legacy data types for binary data (big-endian)
+BINARY_TYPES = {'float': '>f4', 'double': '>f8', 'int': '>i4', 'long': '>i8', 'vtkidtype': '>i8',
+                'short': '>i2', 'char': '>i1', 'unsigned_char': '>u1', 'unsigned_short': '>u2',
+                'unsigned_int': '>u4', 'unsigned_long': '>u8', 'vtktypeint32': '>i4', 'vtktypeint64': '>i8'}
+
+
+def add_polygons_to_vtk(vtk_file, polygons, celldata=None, binary=False):
+    """Write the polygons as legacy POLYDATA to a file opened in binary mode."""
 
     # size up the problem
-    nPolygons = len(polygons)
-    nPolyPts = np.zeros(nPolygons, dtype=int)
-    points = np.empty((0, 2))
-    for i in range(nPolygons):
-        xy = np.array(polygons[i].exterior.xy).transpose()
-        nPolyPts[i] = xy.shape[0]
-        points = np.append(points, xy, axis=0)
+    points, nPolyPts_ranges = as_vertices(polygons)
+    nPolygons = len(nPolyPts_ranges)-1
+    nPolyPts = np.diff(nPolyPts_ranges)
     nPoints = points.shape[0]
-    nPolyPts_ranges = np.insert(np.cumsum(nPolyPts), 0, 0)
 
     # write to file
-    vtk_file.write('DATASET POLYDATA\n')
+    vtk_file.write(b'DATASET POLYDATA\n')
 
     # write all point coordinates (2D -> 3D with z=0)
-    vtk_file.write('POINTS %d float\n' % nPoints)
-    for x, y in points:
-        vtk_file.write('%g %g %g\n' % (x, y, 0))
+    xyz = np.column_stack([points, np.zeros(nPoints)])
+    if binary:
+        vtk_file.write(b'POINTS %d double\n' % nPoints)
+        vtk_file.write(xyz.astype('>f8').tobytes())
+        vtk_file.write(b'\n')
+    else:
+        vtk_file.write(b'POINTS %d float\n' % nPoints)
+        np.savetxt(vtk_file, xyz, fmt='%g')
 
-    # write all polygon connectivities
+    # write all polygon connectivities, each as: size index_0 index_1 ...
     size = np.sum(nPolyPts)+nPolygons  # dont forget the integer for poly size
-    vtk_file.write('POLYGONS %d %d\n' % (nPolygons, size))
-    for i in range(nPolygons):
-        vtk_file.write('%d' % nPolyPts[i])
-        for idx in range(nPolyPts_ranges[i], nPolyPts_ranges[i+1]):
-            vtk_file.write(' %d' % idx)
-        vtk_file.write('\n')
+    vtk_file.write(b'POLYGONS %d %d\n' % (nPolygons, size))
+    connectivity = np.empty(size, dtype=int)
+    is_size = np.zeros(size, dtype=bool)
+    is_size[nPolyPts_ranges[:-1]+np.arange(nPolygons)] = True
+    connectivity[is_size] = nPolyPts
+    connectivity[~is_size] = np.arange(nPoints)
+    if binary:
+        vtk_file.write(connectivity.astype('>i4').tobytes())
+        vtk_file.write(b'\n')
+    else:
+        separators = np.where(np.roll(is_size, -1), '\n', ' ')  # new line before each size
+        separators[-1] = '\n'
+        text = np.char.add(connectivity.astype(str), separators)
+        vtk_file.write(''.join(text.tolist()).encode())
 
     # (optionally) write ID
     if celldata is not None:
-        vtk_file.write('CELL_DATA %d\n' % nPolygons)
-        if type(celldata) is str:
-            name = celldata.pop('name', 'celldata')
-            dat = np.array(celldata['data'])  # should be 1D or 2D data
-        else:
-            name = 'celldata'
-            dat = celldata
-        dat = dat[:, np.newaxis] if dat.ndim == 1 else dat
+        vtk_file.write(b'CELL_DATA %d\n' % nPolygons)
+        name, dat = as_celldata(celldata)
         dim = dat.shape[1]
-        type_ = get_type(dat)
-        vtk_file.write('SCALARS %s %s %d\n' % (name, type_, dim))
-        vtk_file.write('LOOKUP_TABLE default\n')
-        for dat_i in dat:
-            line = ('{} '*dim)[:-1].format(*dat_i)
-            vtk_file.write(line+'\n')
+        if binary:
+            type_ = 'int' if dat.dtype.kind in 'iub' else 'double'
+        else:
+            type_ = get_type(dat)
+        vtk_file.write(b'SCALARS %s %s %d\n' % (name.encode(), type_.encode(), dim))
+        vtk_file.write(b'LOOKUP_TABLE default\n')
+        if binary:
+            vtk_file.write(dat.astype(BINARY_TYPES[type_]).tobytes())
+            vtk_file.write(b'\n')
+        else:
+            np.savetxt(vtk_file, dat, fmt='%d' if type_ == 'int' else '%.17g')
 
 
 def get_type(array):
@@ -76,45 +130,73 @@ def get_type(array):
         return "float"
 
 
-def read_polygons(filepath):
-    """Read polygons from a (legacy) VTK file."""
+def read_polygons(filepath, vertices=False):
+    """Read polygons from a VTK file, legacy (ASCII or binary) or XML PolyData (.vtp).
+    Returns the polygons and the cell data (a dict with name and data, or None).
+    With vertices=True, the polygons are returned as a vertex buffer tuple
+    (vertices, offsets) instead, see packing.geometry.ragged.
+    """
+    with open(filepath, 'rb') as vtk_file:
+        start = vtk_file.read(64).lstrip()
+    if start.startswith(b'<'):
+        xy, offsets, polydata = read_vtp(filepath)
+    else:
+        xy, offsets, polydata = read_vtk(filepath)
+    if vertices:
+        return (xy, offsets), polydata
+    return list(unragged(xy, offsets)), polydata
+
 
-    with open(filepath, 'r') as vtk_file:
+def read_vtk(filepath):
+    """Read a legacy VTK file with polygons.
+    Both layouts of the polygons are supported: sizes and indices interleaved (up to
+    version 4.2) or separate OFFSETS and CONNECTIVITY arrays (version 5.1, VTK >= 9).
+    Returns the points (M, 2), the polygon offsets (N+1,) and the cell data.
+    """
+
+    with open(filepath, 'rb') as vtk_file:
         header = vtk_file.readline().split()
-        if header[0] != '#' or header[1] != 'vtk' or header[2] != 'DataFile':  # ignore Version
+        if len(header) < 3 or header[0] != b'#' or header[1] != b'vtk' or header[2] != b'DataFile':
             raise Exception('invalid VTK file provided')
+        version = float(header[-1]) if len(header) > 4 else 2.0
         _ = vtk_file.readline()  # comment
-        ascii_or_binary = vtk_file.readline().rstrip()
-        if ascii_or_binary.upper() != 'ASCII':
-            raise NotImplementedError('can only read ascii files at the moment')
-        dataset = vtk_file.readline().split()  # DATASET POLYDATA
+        ascii_or_binary = vtk_file.readline().strip().upper()
+        if ascii_or_binary not in {b'ASCII', b'BINARY'}:
+            raise Exception('expected ASCII or BINARY, got %s' % ascii_or_binary.decode())
+        reader = _LegacyReader(vtk_file, binary=ascii_or_binary == b'BINARY')
+        dataset = reader.keyword()  # DATASET POLYDATA
         if dataset[1].upper() != 'POLYDATA':
             raise Exception('expected POLYDATA, got %s' % dataset[1])
 
         # read points
-        points = vtk_file.readline().split()  # POINTS <N> <type>
+        points = reader.keyword()  # POINTS <N> <type>
         if points[0].upper() != 'POINTS':
             raise Exception('expected POINTS, got %s' % points[0])
         num_pts = int(points[1])
-        pts = []
-        for i in range(num_pts):
-            xyz = vtk_file.readline().split()
-            pts.append((float(xyz[0]), float(xyz[1])))
+        pts = reader.values(3*num_pts, points[2]).reshape((num_pts, 3))[:, :2]
 
         # read polygons
-        polygons = vtk_file.readline().split()  # POLYGONS <N> <M>
+        polygons = reader.keyword()  # POLYGONS <N> <M>
         if polygons[0].upper() != 'POLYGONS':
             raise Exception('expected POLYGONS, got %s' % polygons[0])
-        num_poly = int(polygons[1])
-        poly = []
-        for i in range(num_poly):
-            vertices = vtk_file.readline().split()
-            _ = int(vertices[0])  # num_vert
-            xy = [pts[int(v)] for v in vertices[1:]]
-            poly.append(Polygon(xy))
+        if version >= 5:  # POLYGONS <N+1> <M>, then the offsets and indices
+            num_poly = int(polygons[1])-1
+            offsets = reader.array('OFFSETS', num_poly+1).astype(int)
+            connectivity = reader.array('CONNECTIVITY', int(polygons[2])).astype(int)
+            xy = pts[connectivity]
+        else:  # POLYGONS <N> <M>, each polygon as: size index_0 index_1 ...
+            num_poly = int(polygons[1])
+            connectivity = reader.values(int(polygons[2]), 'int').astype(int)
+            starts = np.zeros(num_poly+1, dtype=int)  # position of the size of each polygon
+            for i in range(num_poly):  # the sizes need to be visited in sequence
+                starts[i+1] = starts[i] + 1 + connectivity[starts[i]]
+            offsets = starts - np.arange(num_poly+1)
+            is_size = np.zeros(len(connectivity), dtype=bool)
+            is_size[starts[:-1]] = True
+            xy = pts[connectivity[~is_size]]
 
         # read cell data
-        celldata = vtk_file.readline().split()  # CELL_DATA <N>
+        celldata = reader.keyword()  # CELL_DATA <N>
         if len(celldata)==0 or celldata[0].upper() != 'CELL_DATA':
             # either at EOF or else we ignore the rest of file
             polydata = None
@@ -124,20 +206,222 @@ def read_polygons(filepath):
             num_cells = int(celldata[1])
             if num_cells != num_poly:
                 raise Exception('expected same number of cells as polygons (%d), but got %d' % (num_poly, num_cells))
-            scalars = vtk_file.readline().split()  # SCALARS <name> <type> <N>
-            name = scalars[1]
-            type_ = scalars[2]
-            num_scalars = int(scalars[3])
+            scalars = reader.keyword()  # SCALARS <name> <type> <N>
             if scalars[0].upper() != 'SCALARS':
                 raise Exception('expected SCALARS, got %s' % scalars[0])
-            table = vtk_file.readline().split()  # LOOKUP_TABLE default
+            name = scalars[1]
+            type_ = scalars[2]
+            num_scalars = int(scalars[3]) if len(scalars) > 3 else 1
+            table = reader.keyword()  # LOOKUP_TABLE default
             if table[0].upper() != 'LOOKUP_TABLE':
                 raise Exception('expected LOOKUP_TABLE, got %s' % table[0])
-            polydata = np.empty((num_cells, num_scalars), dtype=type_)
-            for i in range(num_cells):
-                vals = vtk_file.readline().rstrip()
-                polydata[i,:] = vals.split()
+            polydata = reader.values(num_cells*num_scalars, type_).reshape((num_cells, num_scalars))
             polydata = dict(name=name, data=polydata)
 
         # done
-        return poly, polydata
+        return xy, offsets, polydata
+
+
+class _LegacyReader:
+    """Read keyword lines and (ASCII or big-endian binary) values of a legacy VTK file."""
+
+    def __init__(self, vtk_file, binary):
+        self.file = vtk_file
+        self.binary = binary
+
+    def keyword(self):
+        """Read the next non-empty line, split into words (empty at EOF).
+        METADATA blocks (written by VTK) are skipped, they end with an empty line.
+        """
+        line = b''
+        while not line.strip():
+            line = self.file.readline()
+            if not line:
+                return []
+            if line.strip().upper() == b'METADATA':
+                while line.strip():
+                    line = self.file.readline()
+        return line.decode().split()
+
+    def array(self, keyword, count):
+        """Read count values after the keyword line: <keyword> <type>."""
+        words = self.keyword()
+        if len(words) < 2 or words[0].upper() != keyword:
+            raise Exception('expected %s, got %s' % (keyword, ' '.join(words)))
+        return self.values(count, words[1])
+
+    def values(self, count, type_):
+        """Read count values of the (VTK) type."""
+        dtype = np.dtype(BINARY_TYPES.get(type_.lower(), '>f8'))
+        if self.binary:
+            data = np.frombuffer(self.file.read(count*dtype.itemsize), dtype=dtype, count=count)
+            return data.astype(dtype.newbyteorder('='))
+        words = []
+        while len(words) < count:
+            line = self.file.readline()
+            if not line:
+                raise Exception('unexpected end of file')
+            words.extend(line.split())
+        dtype = float if dtype.kind == 'f' else int
+        return np.array(words, dtype=dtype)
+
+
+# ============================== #
+#         XML PolyData           #
+# ============================== #
+
+# XML data types
+XML_TYPES = {'Float32': '<f4', 'Float64': '<f8', 'Int8': '<i1', 'Int16': '<i2', 'Int32': '<i4',
+             'Int64': '<i8', 'UInt8': '<u1', 'UInt16': '<u2', 'UInt32': '<u4', 'UInt64': '<u8'}
+
+
+def add_polygons_to_vtp(vtp_file, polygons, celldata=None, binary=False):
+    """Write the polygons as XML PolyData to a file opened in binary mode.
+    With binary, all arrays are stored as appended raw data (little-endian, with a
+    UInt64 byte count before each array), otherwise inline as ASCII.
+    """
+
+    points, offsets = as_vertices(polygons)
+    nPolygons = len(offsets)-1
+    nPoints = points.shape[0]
+    arrays = [('Points', None, np.column_stack([points, np.zeros(nPoints)]).astype('<f8')),
+              ('Polys', 'connectivity', np.arange(nPoints, dtype='<i8')),
+              ('Polys', 'offsets', offsets[1:].astype('<i8'))]
+    if celldata is not None:
+        name, dat = as_celldata(celldata)
+        dat = dat.astype('<i8' if dat.dtype.kind in 'iub' else '<f8')
+        arrays.append(('CellData', name, dat))
+
+    def data_array(name, dat, offset):
+        type_ = [k for k, v in XML_TYPES.items() if np.dtype(v) == dat.dtype][0]
+        ncomp = dat.shape[1] if dat.ndim == 2 else 1
+        attrs = 'type="%s" NumberOfComponents="%d"' % (type_, ncomp)
+        if name is not None:
+            attrs += ' Name="%s"' % name
+        if binary:
+            return '<DataArray %s format="appended" offset="%d"/>\n' % (attrs, offset)
+        fmt = '%.17g' if dat.dtype.kind == 'f' else '%d'
+        values = ' '.join(np.char.mod(fmt, dat.ravel()).tolist())
+        return '<DataArray %s format="ascii">\n%s\n</DataArray>\n' % (attrs, values)
+
+    # build the xml sections (each array of appended data is prefixed with its size)
+    sections = {'Points': '', 'Polys': '', 'CellData': ''}
+    offset = 0
+    for section, name, dat in arrays:
+        sections[section] += data_array(name, dat, offset)
+        offset += 8 + dat.nbytes
+    celldata_attr = ' Scalars="%s"' % arrays[-1][1] if celldata is not None else ''
+    xml = ('<?xml version="1.0"?>\n'
+           '<VTKFile type="PolyData" version="1.0" byte_order="LittleEndian" header_type="UInt64">\n'
+           '<PolyData>\n'
+           '<Piece NumberOfPoints="%d" NumberOfVerts="0" NumberOfLines="0" NumberOfStrips="0" NumberOfPolys="%d">\n'
+           '<Points>\n%s</Points>\n'
+           '<Polys>\n%s</Polys>\n'
+           '<CellData%s>\n%s</CellData>\n'
+           '</Piece>\n'
+           '</PolyData>\n') % (nPoints, nPolygons, sections['Points'], sections['Polys'],
+                               celldata_attr, sections['CellData'])
+    vtp_file.write(xml.encode())
+    if binary:
+        vtp_file.write(b'<AppendedData encoding="raw">\n_')
+        for _, _, dat in arrays:
+            vtp_file.write(np.uint64(dat.nbytes).astype('<u8').tobytes())
+            vtp_file.write(dat.tobytes())
+        vtp_file.write(b'\n</AppendedData>\n')
+    vtp_file.write(b'</VTKFile>\n')
+
+
+# decompressors of the XML compressor attribute (LZ4 is not in the standard library)
+DECOMPRESSORS = {'vtkZLibDataCompressor': zlib.decompress, 'vtkLZMADataCompressor': lzma.decompress}
+
+
+def b64decode(text):
+    """Decode base64 text that may consist of several padded parts.
+    VTK encodes the header and the data of an array separately.
+    """
+    parts = re.split(rb'(?<==)(?=[^=])', b''.join(text.split()))  # split after padding
+    return b''.join(base64.b64decode(part) for part in parts)
+
+
+def unpack(buffer, header_type, decompress=None):
+    """Read the data of a binary array, starting with its header, from a buffer.
+    Uncompressed, the header is the number of bytes. Compressed, it is the number of
+    blocks, the size of a block and of the last block, then the size of each compressed block.
+    """
+    size = header_type.itemsize
+    if decompress is None:
+        nbytes = int(np.frombuffer(buffer, dtype=header_type, count=1)[0])
+        return buffer[size:size+nbytes]
+    nblocks = int(np.frombuffer(buffer, dtype=header_type, count=1)[0])
+    header = np.frombuffer(buffer, dtype=header_type, count=3+nblocks).astype(int)
+    ends = (3+nblocks)*size + np.cumsum(header[3:])
+    starts = ends - header[3:]
+    return b''.join(decompress(buffer[start:end]) for start, end in zip(starts, ends))
+
+
+def read_vtp(filepath):
+    """Read an XML PolyData file with polygons.
+    The arrays are either inline (ascii or base64 binary) or appended (raw or base64),
+    and binary data may be compressed with zlib or lzma.
+    Returns the points (M, 2), the polygon offsets (N+1,) and the cell data.
+    """
+
+    with open(filepath, 'rb') as vtp_file:
+        content = vtp_file.read()
+
+    # split off the appended data, which is not valid xml
+    appended, encoding = None, None
+    start = content.find(b'<AppendedData')
+    if start >= 0:
+        tag_end = content.index(b'>', start)
+        tag = ET.fromstring(content[start:tag_end].rstrip(b'/') + b'/>')
+        encoding = tag.get('encoding', 'raw')
+        if encoding not in {'raw', 'base64'}:
+            raise Exception('expected raw or base64 appended data, got %s' % encoding)
+        appended = content[content.index(b'_', tag_end)+1:]
+        if encoding == 'base64':  # offsets count characters, up to the end tag
+            appended = appended[:appended.index(b'<')].rstrip()
+        content = content[:start] + b'</VTKFile>'
+    root = ET.fromstring(content)
+    if root.get('type') != 'PolyData':
+        raise Exception('expected PolyData, got %s' % root.get('type'))
+    byte_order = '<' if root.get('byte_order', 'LittleEndian') == 'LittleEndian' else '>'
+    header_type = np.dtype(byte_order + XML_TYPES[root.get('header_type', 'UInt32')][1:])
+    compressor = root.get('compressor')
+    if compressor is not None and compressor not in DECOMPRESSORS:
+        raise Exception('cannot read data compressed by %s' % compressor)
+    decompress = DECOMPRESSORS.get(compressor)
+
+    def read_array(element):
+        dtype = np.dtype(byte_order + XML_TYPES[element.get('type')][1:])
+        ncomp = int(element.get('NumberOfComponents', 1))
+        fmt = element.get('format')
+        if fmt == 'ascii':
+            dat = np.array(element.text.split(), dtype=dtype.newbyteorder('='))
+        elif fmt in {'binary', 'appended'}:
+            if fmt == 'binary':
+                buffer = b64decode(element.text.encode())
+            elif encoding == 'base64':
+                buffer = b64decode(appended[int(element.get('offset')):])
+            else:
+                buffer = memoryview(appended)[int(element.get('offset')):]
+            dat = np.frombuffer(unpack(buffer, header_type, decompress), dtype=dtype)
+            dat = dat.astype(dtype.newbyteorder('='))
+        else:
+            raise Exception('expected ascii, binary or appended data, got %s' % fmt)
+        return dat.reshape((-1, ncomp))
+
+    piece = root.find('PolyData/Piece')
+    pts = read_array(piece.find('Points/DataArray'))[:, :2]
+    polys = {a.get('Name'): read_array(a).ravel() for a in piece.findall('Polys/DataArray')}
+    offsets = np.concatenate([[0], polys['offsets']]).astype(int)
+    xy = pts[polys['connectivity'].astype(int)]
+
+    # read cell data (only the first array)
+    polydata = None
+    cells = piece.findall('CellData/DataArray')
+    if cells:
+        polydata = dict(name=cells[0].get('Name', 'celldata'), data=read_array(cells[0]))
+
+    # done
+    return xy, offsets, polydata
@@ -1,2 +1,6 @@
 from .packing import PolyPacker
-from .auxiliary import overlap, update
+from .ensemble import Ensemble
+from .parallel import ParallelExecutor
+from .domain import DomainPacker
+from .auxiliary import DensityMonitor, overlap, update
+from .stats import Stats
@@ -1,4 +1,7 @@
 import numpy as np
+import shapely
+
+from .geometry import areas, bounds, rotated, split, take, translated, unragged
 
 
 def overlap(polygons, region=None, rel_abs='abs'):
@@ -6,11 +9,9 @@ def overlap(polygons, region=None, rel_abs='abs'):
     # check if region was provided
     if region is None:
         return 0
-    # calculate overlap
-    overlap_area = 0
-    for polygon in polygons:
-        intersection = region.intersection(polygon)
-        overlap_area += intersection.area
+    # calculate overlap (vectorised over all polygons)
+    intersection = shapely.intersection(region, np.asarray(polygons, dtype=object))
+    overlap_area = np.sum(shapely.area(intersection))
     if rel_abs == 'abs':
         return overlap_area
     elif rel_abs == 'rel':
@@ -19,18 +20,162 @@ def overlap(polygons, region=None, rel_abs='abs'):
         raise Exception("rel_abs must be 'rel' or 'abs'")
 
 
-def update(packer, region):
+def update(packer, region, monitor=None):
+    """Compute the state of the packer for the UI.
+    Returns the polygons (global frame), the density in the region and the number
+    of collisions. Pass a DensityMonitor (for the same region) to compute the density
+    incrementally, instead of intersecting every polygon with the region.
+    """
 
     # polygons
     polygons = packer.get_polygons(FoR='global')
 
     # collisions
-    intersection_matrix = packer.find_intersections()
-    intersections = np.sum(np.triu(intersection_matrix, 1), 1)
-    collisions = np.sum(intersections[:-1])  # last one is self, so omit it
+    contacts = packer.find_contacts()
+    collisions = len(contacts)  # each pair counts once
 
     # density
-    density = overlap(polys, region, rel_abs='rel')
+    if monitor is not None:
+        density = monitor.update()
+    else:
+        density = overlap(polygons, region, rel_abs='rel')
 
     # return
     return polygons, density, collisions
+
+
+class DensityMonitor:
+    """Monitor the density of a packer's polygons in a region (see overlap).
+    The overlap of each polygon is cached and only recomputed for the polygons that
+    moved (or rotated) since the last update, in one of two modes:
+      - 'exact': polygons whose bounding circle lies entirely inside (or outside) the
+        region count with their cached area (or zero). Only polygons that straddle
+        the boundary of the (prepared) region are intersected with it.
+      - 'raster': each polygon is sampled on a grid with spacing resolution, and the
+        samples are looked up in a rasterised mask of the region. Cheap but approximate.
+    """
+
+    def __init__(self, packer, region, mode='exact', resolution=None):
+        if mode not in {'exact', 'raster'}:
+            raise Exception("mode must be 'exact' or 'raster'")
+        self.packer = packer
+        self.region = region
+        self.mode = mode
+        shapely.prepare(region)  # speed up repeated predicates
+        self._boundary = region.boundary
+        shapely.prepare(self._boundary)
+        x0, y0, x1, y1 = region.bounds
+        self.resolution = resolution or max(x1-x0, y1-y0)/256  # grid spacing for 'raster'
+        if mode == 'raster':
+            self._rasterise_region()
+        self.reset()
+
+    def reset(self):
+        """Forget the cached state, the next update recomputes all polygons."""
+        self._centers = np.empty((0, 2))  # centres at the last update
+        self._orientation = np.empty(0, dtype=int)  # orientations at the last update
+        self._overlap = np.empty(0)  # overlap area of each polygon
+        self._shapes = None  # per-shape data, depends on the packer's polygons
+
+    def update(self):
+        """Update the overlap of the polygons that moved and return the density."""
+        packer = self.packer
+        if self._shapes is None or len(self._overlap) != packer.N:
+            self.reset()
+            self._shapes = self._prepare_shapes()
+            moved = np.arange(packer.N)
+            self._overlap = np.zeros(packer.N)
+        else:
+            moved = np.flatnonzero(np.any(packer.centers != self._centers, axis=1)
+                                   | (packer.orientation != self._orientation))
+        if len(moved):
+            if self.mode == 'exact':
+                self._overlap[moved] = self._exact(moved)
+            else:
+                self._overlap[moved] = self._raster(moved)
+        self._centers = packer.centers.copy()
+        self._orientation = packer.orientation.copy()
+        return self.density
+
+    @property
+    def density(self):
+        """Relative overlap of the polygons with the region at the last update."""
+        return np.sum(self._overlap)/self.region.area
+
+    def _prepare_shapes(self):
+        """Compute the per-shape data of the packer's polygons (local frame).
+        The samples are of the shapes as they are now, i.e. rotated by the current angles.
+        """
+        vertices, offsets = self.packer.get_vertices('local')
+        self._angles = self.packer.angles.copy()
+        shapes = dict(areas=areas(vertices, offsets))
+        if self.mode == 'raster':
+            shapes['samples'], shapes['sample_offsets'] = self._sample_shapes(vertices, offsets)
+        return shapes
+
+    # ============================== #
+    #             Exact              #
+    # ============================== #
+
+    def _exact(self, idx):
+        """Compute the overlap area of the polygons idx with the region."""
+        packer = self.packer
+        x0y0 = packer.centers[idx]
+        radii = packer._radii[idx]
+        inside = shapely.contains_xy(self.region, x0y0[:, 0], x0y0[:, 1])
+        clearance = shapely.distance(self._boundary, shapely.points(x0y0))
+        result = np.where(inside, self._shapes['areas'][idx], 0.)
+        straddles = clearance < radii  # bounding circle crosses the boundary
+        if np.any(straddles):
+            sub = idx[straddles]
+            vertices, offsets = take(*packer.get_vertices('local'), sub)
+            polygons = unragged(translated(vertices, offsets, packer.centers[sub]), offsets)
+            result[straddles] = shapely.area(shapely.intersection(self.region, polygons))
+        return result
+
+    # ============================== #
+    #             Raster             #
+    # ============================== #
+
+    def _rasterise_region(self):
+        """Sample the region on a grid (cell centres) with spacing resolution."""
+        h = self.resolution
+        x0, y0, x1, y1 = self.region.bounds
+        self._origin = np.array([x0, y0])
+        nx, ny = int(np.ceil((x1-x0)/h)), int(np.ceil((y1-y0)/h))
+        x = x0 + h*(np.arange(nx)+0.5)
+        y = y0 + h*(np.arange(ny)+0.5)
+        X, Y = np.meshgrid(x, y, indexing='ij')
+        self._mask = shapely.contains_xy(self.region, X, Y)  # (nx, ny)
+
+    def _sample_shapes(self, vertices, offsets):
+        """Sample each shape (local frame) on a grid with spacing resolution.
+        Returns the sample points as a ragged buffer. Each shape gets at least one
+        sample (its mid-point), and each sample represents an equal share of its area.
+        """
+        h = self.resolution
+        samples, counts = [], []
+        for xy, (x0, y0, x1, y1) in zip(split(vertices, offsets), bounds(vertices, offsets)):
+            x = np.arange(np.floor(x0/h), np.ceil(x1/h)+1)*h
+            y = np.arange(np.floor(y0/h), np.ceil(y1/h)+1)*h
+            X, Y = np.meshgrid(x, y, indexing='ij')
+            inside = shapely.contains_xy(shapely.Polygon(xy), X, Y)
+            pts = np.column_stack([X[inside], Y[inside]]) if np.any(inside) else np.zeros((1, 2))
+            samples.append(pts)
+            counts.append(len(pts))
+        return np.concatenate(samples), np.concatenate([[0], np.cumsum(counts)])
+
+    def _raster(self, idx):
+        """Estimate the overlap area of the polygons idx with the region."""
+        samples, offsets = take(self._shapes['samples'], self._shapes['sample_offsets'], idx)
+        if self.packer.orientations:
+            samples = rotated(samples, offsets, self.packer.angles[idx]-self._angles[idx])
+        xy = translated(samples, offsets, self.packer.centers[idx])
+        ij = np.floor((xy-self._origin)/self.resolution).astype(int)
+        nx, ny = self._mask.shape
+        valid = (ij[:, 0] >= 0) & (ij[:, 0] < nx) & (ij[:, 1] >= 0) & (ij[:, 1] < ny)
+        hit = np.zeros(len(xy), dtype=bool)
+        hit[valid] = self._mask[ij[valid, 0], ij[valid, 1]]
+        counts = np.diff(offsets)
+        fraction = np.add.reduceat(hit.astype(float), offsets[:-1])/counts
+        return fraction*self._shapes['areas'][idx]
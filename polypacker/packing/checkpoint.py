@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import shapely
+
+
+VERSION = 1  # version of the checkpoint format, increment when it changes
+
+
+def save_checkpoint(packer, filepath):
+    """Write the state of the packer to a (compressed) .npz file.
+    The file is written to a temporary file first and then renamed, so that an
+    existing checkpoint is only replaced by a complete one.
+    """
+    write_checkpoint(snapshot(packer), filepath)
+
+
+def snapshot(packer):
+    """Copy the state of the packer (see save_checkpoint)."""
+    vertices, offsets = packer.get_vertices('local')
+    if packer.orientations:  # store the shapes unrotated (orientation bin 0)
+        vertices = packer._rotated_buf[:len(vertices), 0]
+    return dict(version=np.array(VERSION),
+                centers=packer.centers.copy(),
+                vertices=vertices.copy(),
+                offsets=offsets.copy(),
+                orientations=np.array(packer.orientations or 0),
+                orientation=packer.orientation.copy(),
+                box=np.array([] if packer.box is None else packer.box),
+                region=np.array('' if packer.field is None else shapely.to_wkb(packer.field.region, hex=True)),
+                resolution=np.array(0. if packer.field is None else packer.field.resolution),
+                radii=packer._radii.copy(),
+                iteration=np.array(packer.iteration),
+                skin=np.array(packer.neighbours.skin),
+                rng=np.array(json.dumps(packer.rng.bit_generator.state)),
+                driver=np.array(json.dumps(packer.driver, default=_scalar)))
+
+
+def _scalar(value):
+    """Convert a numpy scalar of the run parameters to a JSON serialisable value."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise Exception('cannot save run parameter of type %s in a checkpoint' % type(value).__name__)
+
+
+def write_checkpoint(state, filepath):
+    """Atomically write a snapshot to filepath."""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmppath = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as tmpfile:
+            np.savez_compressed(tmpfile, **state)
+            tmpfile.flush()
+            os.fsync(tmpfile.fileno())
+        os.replace(tmppath, filepath)
+    except BaseException:
+        os.remove(tmppath)
+        raise
+
+
+def load_checkpoint(filepath, packer):
+    """Restore the state of an (empty) packer from a checkpoint file.
+    The packer needs the same orientations (see PolyPacker) as the saved one.
+    """
+    with np.load(filepath) as data:
+        version = int(data['version'])
+        if version > VERSION:
+            raise Exception('checkpoint version %d is newer than supported (%d)' % (version, VERSION))
+        packer.neighbours.skin = float(data['skin'])
+        orientations = int(data['orientations'])
+        if orientations != (packer.orientations or 0):
+            raise Exception('checkpoint has %d orientations, packer has %d' % (orientations, packer.orientations or 0))
+        packer._append(data['vertices'], data['offsets'], data['centers'])
+        if orientations:
+            packer.rotate(np.arange(packer.N), data['orientation'])
+        if data['box'].size:
+            packer.box = data['box'].copy()
+        if str(data['region']):  # see PolyPacker.set_region
+            packer.set_region(shapely.from_wkb(str(data['region'])), float(data['resolution']))
+        packer.iteration = int(data['iteration'])
+        packer.rng.bit_generator.state = json.loads(str(data['rng']))
+        packer.driver = json.loads(str(data['driver']))
+    return packer
+
+
+class CheckpointWriter:
+    """Write checkpoints, optionally in a background thread.
+    In the background, only copying the state blocks the caller; the next checkpoint
+    waits for the previous one to finish. An error while writing in the background is
+    raised by the next write or wait.
+    """
+
+    def __init__(self, filepath, background=False):
+        self.filepath = filepath
+        self.background = background
+        self._thread = None
+        self._error = None  # of the checkpoint written in the background
+
+    def write(self, packer):
+        state = snapshot(packer)
+        self.wait()
+        if self.background:
+            self._thread = threading.Thread(target=self._write, args=(state,))
+            self._thread.start()
+        else:
+            write_checkpoint(state, self.filepath)
+
+    def _write(self, state):
+        try:
+            write_checkpoint(state, self.filepath)
+        except BaseException as error:
+            self._error = error
+
+    def wait(self):
+        """Wait for a checkpoint that is being written in the background.
+        Raises the error if writing it failed.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
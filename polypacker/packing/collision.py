@@ -0,0 +1,129 @@
+import numpy as np
+import shapely
+
+from .distances import minimum_image, normalize
+from .geometry import next_vertex, unragged, take, translated
+
+
+def is_convex(vertices, offsets):
+    """Check which polygons of a vertex buffer are convex.
+    A polygon is convex if consecutive edges always turn the same way.
+    """
+    if len(offsets) < 2:
+        return np.zeros(0, dtype=bool)
+    nxt = next_vertex(offsets)
+    edges = vertices[nxt]-vertices
+    turns = edges[:, 0]*edges[nxt, 1] - edges[:, 1]*edges[nxt, 0]  # cross product
+    starts = offsets[:-1]
+    return (np.minimum.reduceat(turns, starts) >= 0) | (np.maximum.reduceat(turns, starts) <= 0)
+
+
+def pad(vertices, offsets, idx, K):
+    """Gather polygons idx of a vertex buffer into a (len(idx), K, 2) array.
+    Shorter polygons are padded by repeating their last vertex, which only adds
+    edges of zero length (these are ignored by sat).
+    """
+    counts = offsets[idx+1]-offsets[idx]
+    k = np.minimum(np.arange(K), (counts-1)[:, np.newaxis])
+    return vertices[offsets[idx][:, np.newaxis]+k]
+
+
+def axes(polygons):
+    """Compute the unit edge normals of padded polygons (P, K, 2).
+    Zero-length edges (from padding) give a zero normal.
+    """
+    edges = np.roll(polygons, -1, axis=1)-polygons
+    normals = np.stack([edges[..., 1], -edges[..., 0]], axis=-1)
+    norm = np.sqrt(np.sum(normals**2, axis=-1, keepdims=True))
+    return np.divide(normals, norm, out=np.zeros_like(normals), where=norm>0)
+
+
+def sat(poly_a, poly_b):
+    """Separating axis test of pairs of padded convex polygons (P, K, 2).
+    Returns the intersection flag, the minimum translation vector (unit normal
+    pointing from a towards b) and the penetration depth along it. Touching
+    polygons intersect with zero depth. If separated, the depth is negative.
+    """
+    normals = np.concatenate([axes(poly_a), axes(poly_b)], axis=1)  # (P, 2K, 2)
+    valid = np.any(normals != 0, axis=-1)
+    proj_a = normals @ poly_a.transpose(0, 2, 1)  # (P, 2K, K), batched matmul is much faster than einsum
+    proj_b = normals @ poly_b.transpose(0, 2, 1)
+    min_a, max_a = proj_a.min(axis=-1), proj_a.max(axis=-1)
+    min_b, max_b = proj_b.min(axis=-1), proj_b.max(axis=-1)
+    overlap = np.minimum(max_a, max_b) - np.maximum(min_a, min_b)
+    # containment: also need to push past the nearer end
+    contained = ((min_a <= min_b) & (max_b <= max_a)) | ((min_b <= min_a) & (max_a <= max_b))
+    overlap = np.where(contained, overlap+np.minimum(np.abs(min_a-min_b), np.abs(max_a-max_b)), overlap)
+    overlap = np.where(valid, overlap, np.inf)
+    best = np.argmin(overlap, axis=1)
+    rows = np.arange(len(best))
+    depth = overlap[rows, best]
+    normal = normals[rows, best]
+    # orient the normal from a towards b
+    centre_a = (min_a[rows, best]+max_a[rows, best])/2
+    centre_b = (min_b[rows, best]+max_b[rows, best])/2
+    normal = np.where((centre_b < centre_a)[:, np.newaxis], -normal, normal)
+    return depth >= 0, normal, depth
+
+
+def collide(vertices, offsets, x0y0, pairs, shapes=None, chunk_bytes=2**26):
+    """Run the separating axis test on pairs (i, j) of convex polygons.
+    The vertices are in the local frame and x0y0 are the centres, see sat for the
+    outputs. Pairs are processed in chunks to bound the memory of the batched arrays.
+    If several objects share a shape, shapes[i] is the index of object i's polygon.
+    """
+    P = len(pairs)
+    hit, normal, depth = np.zeros(P, dtype=bool), np.zeros((P, 2)), np.zeros(P)
+    if P == 0:
+        return hit, normal, depth
+    i, j = pairs[:, 0], pairs[:, 1]
+    si, sj = (i, j) if shapes is None else (shapes[i], shapes[j])
+    counts = np.diff(offsets)
+    K = int(max(counts[si].max(), counts[sj].max()))
+    chunk = max(1, chunk_bytes//(8*2*K*K*4))  # two (2K, K) projections per pair
+    for start in range(0, P, chunk):
+        s = slice(start, start+chunk)
+        poly_a = pad(vertices, offsets, si[s], K)
+        poly_b = pad(vertices, offsets, sj[s], K) + (x0y0[j[s]]-x0y0[i[s]])[:, np.newaxis, :]  # relative to a
+        hit[s], normal[s], depth[s] = sat(poly_a, poly_b)
+    return hit, normal, depth
+
+
+def circles(x0y0, radii, pairs, box=None):
+    """Test pairs (i, j) of circles (e.g. bounding circles) for intersection.
+    Returns the same outputs as sat, with distances in the periodic box if given.
+    """
+    i, j = pairs[:, 0], pairs[:, 1]
+    d_xy = minimum_image(x0y0[j]-x0y0[i], box)
+    distance = np.sqrt(np.sum(d_xy**2, axis=1))
+    depth = radii[i]+radii[j]-distance
+    return depth >= 0, normalize(d_xy, axis=1), depth
+
+
+def cull(bounds, inradii, x0y0, pairs, shapes=None):
+    """Decide pairs (i, j) of polygons by cheap tests before an exact test.
+    The bounds (xmin, ymin, xmax, ymax) and inscribed radii are those of the shapes in
+    the local frame (see geometry.bounds and distances.inradii), and x0y0 are the centres.
+    Returns the pairs that certainly miss (disjoint bounding boxes) and those that
+    certainly hit (overlapping inscribed circles). Only the others need an exact test.
+    """
+    i, j = pairs[:, 0], pairs[:, 1]
+    si, sj = (i, j) if shapes is None else (shapes[i], shapes[j])
+    d_xy = x0y0[j]-x0y0[i]
+    box_b = bounds[sj] + np.tile(d_xy, 2)  # relative to a
+    miss = np.any(box_b[:, :2] > bounds[si, 2:], axis=1) | np.any(box_b[:, 2:] < bounds[si, :2], axis=1)
+    hit = np.sum(d_xy**2, axis=1) < (inradii[si]+inradii[sj])**2
+    return miss, hit & ~miss
+
+
+def intersects(vertices, offsets, x0y0, pairs, shapes=None):
+    """Test pairs (i, j) of polygons for intersection with Shapely (exact for any shape).
+    The vertices are in the local frame and x0y0 are the centres. If several objects
+    share a shape, shapes[i] is the index of object i's polygon in the vertex buffer.
+    """
+    # only build the polygons involved, in their global position
+    idx, inverse = np.unique(pairs, return_inverse=True)
+    vertices, offsets = take(vertices, offsets, idx if shapes is None else shapes[idx])
+    geometries = unragged(translated(vertices, offsets, x0y0[idx]), offsets)
+    inverse = inverse.reshape(pairs.shape)
+    return shapely.intersects(geometries[inverse[:, 0]], geometries[inverse[:, 1]])
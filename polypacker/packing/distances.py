@@ -1,5 +1,8 @@
 import numpy as np
-from scipy.spatial import distance_matrix
+from scipy.sparse import coo_matrix
+from scipy.spatial import cKDTree, distance_matrix
+
+from .geometry import next_vertex
 
 
 def midpoint(polygon):
@@ -19,6 +22,20 @@ def normalize(vector, axis=1):
     return normalised
 
 
+def minimum_image(d_xy, box=None):
+    """Apply the minimum image convention to difference vectors in a periodic box.
+    The box (Lx, Ly) is centred at the origin. Without a box, d_xy is returned as is.
+    """
+    if box is None:
+        return d_xy
+    return d_xy - box*np.round(d_xy/box)
+
+
+def wrap(x0y0, box):
+    """Wrap positions into the periodic box [-Lx/2, Lx/2) x [-Ly/2, Ly/2)."""
+    return np.mod(x0y0+box/2, box) - box/2
+
+
 def mat2arr(mat):
     """Convert distance matrix to array format."""
     arr = mat[np.mask_indices(mat.shape[0], np.tril, -1)]  # use tril
@@ -26,6 +43,21 @@ def mat2arr(mat):
     return arr, idx
 
 
+def pairs2matrix(pairs, n, sparse=False):
+    """Convert pair indices to a symmetric boolean matrix.
+    The dense matrix needs O(n^2) memory, so only use it for small n;
+    otherwise request a scipy.sparse matrix (CSR) instead.
+    """
+    i, j = pairs[:, 0], pairs[:, 1]
+    if sparse:
+        data = np.ones(2*len(pairs), dtype=bool)
+        return coo_matrix((data, (np.concatenate([i, j]), np.concatenate([j, i]))), shape=(n, n)).tocsr()
+    matrix = np.zeros((n, n), dtype=bool)
+    matrix[i, j] = True  # \__ symmetric
+    matrix[j, i] = True  # /
+    return matrix
+
+
 def mindist(polygons):
     """Compute the minimum spacing between object pairs."""
     radii = np.array([maxradius(p) for p in polygons])
@@ -50,3 +82,72 @@ def maxradius(polygon):
     xy = np.transpose(polygon.exterior.coords.xy)
     radius = np.max(distance_matrix(xy, [[0,0]]))
     return radius
+
+
+def maxradii(vertices, offsets):
+    """Find the maximum distance of any vertex to the origin for each polygon.
+    Same as maxradius, but for all polygons of a vertex buffer at once
+    (see geometry.ragged). This assumes each polygon is centred around the origin.
+    """
+    squared = np.sum(vertices**2, axis=1)
+    return np.sqrt(np.maximum.reduceat(squared, offsets[:-1]))
+
+
+def inradii(vertices, offsets):
+    """Find the minimum distance of any edge to the origin for each polygon.
+    This is the radius of the largest circle about the origin that fits inside the
+    polygon, or 0 if the origin lies outside (e.g. in a notch of a non-convex polygon).
+    This assumes each polygon is centred around the origin, see maxradii.
+    """
+    a, b = vertices, vertices[next_vertex(offsets)]
+    edge = b-a
+    length2 = np.sum(edge**2, axis=1)
+    t = np.clip(np.divide(-np.sum(a*edge, axis=1), length2, out=np.zeros_like(length2), where=length2>0), 0, 1)
+    squared = np.sum((a+t[:, np.newaxis]*edge)**2, axis=1)  # of the nearest point on each edge
+    # the origin is inside if a ray along +x crosses an odd number of edges
+    straddles = (a[:, 1] > 0) != (b[:, 1] > 0)
+    x = np.divide(a[:, 0]*b[:, 1]-b[:, 0]*a[:, 1], b[:, 1]-a[:, 1], out=np.zeros(len(a)), where=straddles)
+    crossings = np.add.reduceat((straddles & (x > 0)).astype(int), offsets[:-1])
+    return np.where(crossings % 2 == 1, np.sqrt(np.minimum.reduceat(squared, offsets[:-1])), 0.)
+
+
+def broadphase(x0y0, radii, groups=None, active=None, box=None):
+    """Find candidate pairs whose bounding circles overlap.
+    A k-d tree only reports pairs closer than the largest possible spacing,
+    which are then filtered by the sum of each pair's radii. This avoids the
+    full distance matrix of pdist and scales with the number of neighbours.
+    Optionally, objects only pair up within the same group (integer labels),
+    which allows independent systems to share a single tree.
+    Optionally, only pairs involving at least one active object (boolean mask)
+    are searched for.
+    Optionally, the objects are in a periodic box (Lx, Ly) centred at the origin, and
+    pairs are found by their minimum image distance (see minimum_image).
+    Returns the candidate indices (i, j) with i < j, sorted so that the order
+    (and hence any floating point sums over pairs) does not depend on the tree.
+    """
+    if len(x0y0) < 2:
+        return np.empty((0, 2), dtype=int)
+    r = 2*np.max(radii)
+    points, boxsize = x0y0, None
+    if box is not None:  # the tree needs the points in [0, L)
+        if r > np.min(box)/2*(1+1e-12):  # up to rounding, see forces.compression
+            raise Exception('periodic box is too small for the largest objects')
+        points = np.mod(x0y0+box/2, box)
+        boxsize = box
+    if groups is not None:  # separate the groups in a third dimension
+        points = np.column_stack([points, np.asarray(groups)*(2*r+1)])
+        if box is not None:  # periodic in the third dimension too, but groups never touch
+            boxsize = np.append(box, (np.max(groups)+1)*(2*r+1))
+    tree = cKDTree(points, boxsize=boxsize)
+    if active is None:
+        indices = tree.query_pairs(r, output_type='ndarray')
+        indices = indices[np.lexsort((indices[:, 1], indices[:, 0]))]
+    else:
+        sub = np.flatnonzero(active)
+        near = cKDTree(points[sub], boxsize=boxsize).sparse_distance_matrix(tree, r, output_type='ndarray')
+        i, j = sub[near['i']], near['j']
+        indices = np.column_stack([np.minimum(i, j), np.maximum(i, j)])[i != j]
+        indices = np.unique(indices, axis=0).reshape((-1, 2))  # sorted, pairs of two active objects appear twice
+    i, j = indices[:, 0], indices[:, 1]
+    distances = np.sqrt(np.sum(minimum_image(x0y0[i]-x0y0[j], box)**2, axis=1))
+    return indices[distances <= radii[i]+radii[j]]
@@ -0,0 +1,445 @@
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import pickle
+
+import numpy as np
+
+from .collision import cull, intersects, is_convex
+from .distances import broadphase, inradii, maxradii
+from .forces import attraction, repulsion
+from .geometry import bounds, take
+from .packing import _reserve
+
+
+class DomainPacker:
+    """Pack the polygons of a PolyPacker with a domain decomposition.
+    The plane is split into vertical strips, each owned by a worker process which
+    only holds the polygons centred in its strip (see Domain). In each step, the
+    polygons within the halo width of a strip's edge are sent to the neighbouring
+    strip as ghost copies (halo exchange), so that every strip finds all contacts of
+    its own polygons. Polygons that moved across an edge then migrate to the neighbour.
+    The strips are balanced by the number of polygons (see rebalance).
+    The processes only talk through Channels (pipes here), so a strip could also be
+    served on another node over a socket (see _serve).
+    Steps are the same as PolyPacker.step (without depth, rotation or periodic box),
+    including the attraction into the packer's region (see PolyPacker.set_region).
+
+        with DomainPacker(packer, strips=8) as domains:
+            history = domains.run(nsteps, att, rep)  # updates packer.centers
+
+    Use as a context manager or call close() to stop the workers.
+    """
+
+    def __init__(self, packer, strips=None, *, halo=None):
+        """Distribute the polygons of the packer over a number of strips (default: one
+        per CPU). The halo width must be at least the largest distance between the
+        centres of two contacting polygons, the default is twice the largest bounding radius.
+        """
+        if packer.orientations or packer.box is not None:
+            raise Exception('domain decomposition does not support rotation or a periodic box')
+        self.packer = packer
+        self.strips = strips or os.cpu_count()
+        self.halo = halo if halo is not None else 2*np.max(packer._radii, initial=0)
+        self.iteration = 0  # number of steps taken
+        self._controls = []  # channel to each domain
+        self._workers = []
+        vertices, offsets = packer.get_vertices('local')
+        centers = packer.centers
+        edges = self._edges(centers[:, 0])
+        if edges is None:
+            raise Exception('strips are narrower than the halo, use fewer strips')
+        strip = np.searchsorted(edges[1:-1], centers[:, 0], side='right')
+        links = [Channel.pipe() for _ in range(self.strips-1)]  # between neighbouring strips
+        for k in range(self.strips):
+            ids = np.flatnonzero(strip == k)
+            domain = Domain(k, edges[k], edges[k+1], self.halo, ids, centers[ids], *take(vertices, offsets, ids),
+                            field=packer.field)
+            control, remote = Channel.pipe()
+            left = links[k-1][1] if k > 0 else None
+            right = links[k][0] if k < self.strips-1 else None
+            worker = multiprocessing.Process(target=_serve, args=(domain, remote, left, right), daemon=True)
+            worker.start()
+            remote.close()  # the worker's end
+            self._controls.append(control)
+            self._workers.append(worker)
+        for a, b in links:
+            a.close()
+            b.close()
+
+    def _edges(self, x):
+        """Edges of strips with (about) equal numbers of polygons, the outer ones are infinite.
+        Returns None if an inner strip would be narrower than the halo.
+        """
+        edges = np.quantile(x, np.linspace(0, 1, self.strips+1)) if len(x) else np.zeros(self.strips+1)
+        edges[0], edges[-1] = -np.inf, np.inf
+        if np.any(np.diff(edges[1:-1]) < self.halo):
+            return None
+        return edges
+
+    # ============================== #
+    #         Communication          #
+    # ============================== #
+
+    def _call(self, command, *args):
+        """Send a command to all domains and return their results (in order of the strips)."""
+        for control in self._controls:
+            control.send((command, args))
+        results = [None]*len(self._controls)
+        pending = {control.connection: k for k, control in enumerate(self._controls)}
+        while pending:
+            for connection in wait(list(pending)):
+                k = pending.pop(connection)
+                results[k] = self._controls[k].recv()
+                if isinstance(results[k], BaseException):
+                    self.close()  # the other domains may wait for it forever
+                    raise results[k]
+        return results
+
+    def close(self):
+        """Stop the workers."""
+        for control in self._controls:
+            try:
+                control.send(('close', ()))
+            except (BrokenPipeError, OSError):
+                pass  # already gone
+        for worker in self._workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+        self._controls, self._workers = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ============================== #
+    #             Update             #
+    # ============================== #
+
+    def step(self, att=0, rep=0):
+        """Update positions of polygons in all strips (see PolyPacker.step).
+        Returns the number of contacts.
+        """
+        collisions = sum(self._call('step', att, rep))
+        self.iteration += 1
+        return collisions
+
+    def rebalance(self):
+        """Move the strip edges so that the strips hold equal numbers of polygons again,
+        and migrate the polygons accordingly (possibly across several strips).
+        The edges are kept if the strips would become narrower than the halo.
+        Returns whether the edges were moved.
+        """
+        x = np.concatenate(self._call('positions'))[:, 0]
+        edges = self._edges(x)
+        if edges is None:
+            return False
+        self._call('edges', edges)
+        for _ in range(self.strips):
+            if sum(self._call('migrate')) == 0:
+                break
+        return True
+
+    def gather(self):
+        """Update the centres of the packer from the strips."""
+        centers = self.packer.centers.copy()
+        for ids, x0y0 in self._call('centers'):
+            centers[ids] = x0y0
+        self.packer.centers = centers
+
+    def counts(self):
+        """Number of polygons in each strip."""
+        return np.array(self._call('count'))
+
+    def run(self, nsteps, att, rep, *, ui=None, anneal=0.5, patience=10, min_step=None, rebalance_every=50):
+        """Step until converged (at most nsteps times), see PolyPacker.run.
+        The step sizes are annealed once the number of collisions has not fallen for
+        patience iterations, and the run stops when they would fall below min_step.
+        The strips are rebalanced every rebalance_every iterations.
+        The ui is updated with the gathered polygons, but without the density.
+        The packer's centres are updated at the end.
+        Returns a dict with the history of the collisions, the final step sizes, and
+        the reason for stopping ('converged', 'stopped' or 'nsteps').
+        """
+        min_step = min_step if min_step is not None else max(att, rep)/100
+        history = dict(collisions=[])
+        best, stalled = np.inf, 0
+        reason = 'nsteps'
+        for ITER in range(nsteps):
+            collisions = self.step(att, rep)
+            history['collisions'].append(collisions)
+            if rebalance_every and (ITER+1) % rebalance_every == 0:
+                self.rebalance()
+            if ui is not None:
+                if ui.needs_update(ITER):
+                    self.gather()
+                    ui.do_update(ITER, self.packer.get_vertices('global'), None, collisions)
+                if ui.was_stopped:
+                    reason = 'stopped'
+                    break
+            if collisions < best:
+                best, stalled = collisions, 0
+            else:
+                stalled += 1
+            if stalled >= patience:
+                if max(att, rep)*anneal < min_step:
+                    reason = 'converged'
+                    break
+                att, rep = att*anneal, rep*anneal
+                best, stalled = collisions, 0
+        self.gather()
+        history.update(iterations=len(history['collisions']), att=att, rep=rep, reason=reason)
+        return history
+
+
+class Domain:
+    """The polygons centred in a strip lo <= x < hi of the plane (see DomainPacker).
+    Besides its own polygons, a domain holds the ghost copies of the neighbours'
+    polygons within the halo width of its edges. The shapes of both are kept in a
+    ShapeStore, so that the neighbours only send a shape when it enters the halo.
+    """
+
+    def __init__(self, rank, lo, hi, halo, ids, centers, vertices, offsets, field=None):
+        self.rank = rank
+        self.lo, self.hi = lo, hi
+        self.halo = halo
+        self.ids = np.asarray(ids, dtype=int)  # global index of the own polygons
+        self.centers = np.array(centers, dtype=float).reshape((-1, 2))
+        self.shapes = ShapeStore()
+        self.shapes.add(self.ids, vertices, offsets)
+        self.ghost_ids = np.empty(0, dtype=int)
+        self.ghost_centers = np.empty((0, 2), dtype=float)
+        self.field = field  # see PolyPacker.set_region
+        self.neighbours = dict(left=None, right=None)  # Channel to each neighbouring strip
+        self._sent = dict(left=np.empty(0, dtype=int), right=np.empty(0, dtype=int))  # ghosts held by each
+
+    def _exchange(self, outgoing):
+        """Send a message to each neighbour (outgoing: side -> message) and receive theirs.
+        All messages are shifted right, then left. Even strips send first and odd strips
+        receive first, so the blocking channels cannot deadlock.
+        Returns the received messages (side -> message).
+        """
+        incoming = {}
+        for to, source in (('right', 'left'), ('left', 'right')):
+            actions = [(to, 'send'), (source, 'recv')]
+            for side, action in (actions if self.rank % 2 == 0 else actions[::-1]):
+                channel = self.neighbours[side]
+                if channel is None:
+                    continue
+                if action == 'send':
+                    channel.send(outgoing[side])
+                else:
+                    incoming[side] = channel.recv()
+        return incoming
+
+    def _message(self, select, known=None):
+        """Message with the own polygons select (boolean mask), including their shapes,
+        except for the ids in known.
+        """
+        ids = self.ids[select]
+        new = ids if known is None else ids[~np.isin(ids, known)]
+        return dict(ids=ids, centers=self.centers[select], shapes=(new, *self.shapes.get(new)))
+
+    def exchange_halo(self):
+        """Send the own polygons near the edges to the neighbours, receive their ghosts."""
+        x = self.centers[:, 0]
+        near = dict(left=x < self.lo+self.halo, right=x >= self.hi-self.halo)
+        outgoing = {side: self._message(near[side], self._sent[side]) for side in near}
+        for side in near:
+            self._sent[side] = outgoing[side]['ids']
+        incoming = self._exchange(outgoing)
+        for message in incoming.values():
+            self.shapes.add(*message['shapes'])
+        self.ghost_ids = np.concatenate([np.empty(0, dtype=int)]+[m['ids'] for m in incoming.values()])
+        self.ghost_centers = np.concatenate([np.empty((0, 2))]+[m['centers'] for m in incoming.values()])
+        if len(self.shapes) > 2*(len(self.ids)+len(self.ghost_ids))+1024:  # mostly stale shapes
+            self.shapes.compact(np.concatenate([self.ids, self.ghost_ids]))
+
+    def step(self, att=0, rep=0):
+        """Update the own polygons (see PolyPacker.step), then migrate those that left.
+        Returns the number of contacts, where a contact with a ghost is only counted
+        by one of the two strips.
+        """
+        self.exchange_halo()
+        n = len(self.ids)
+        ids = np.concatenate([self.ids, self.ghost_ids])
+        x0y0 = np.concatenate([self.centers, self.ghost_centers])
+        rows = self.shapes.rows(ids)
+        candidates = broadphase(x0y0, self.shapes.radii[rows])
+        candidates = candidates[candidates[:, 0] < n]  # i < j, so drop pairs of two ghosts
+        miss, is_contact = cull(self.shapes.bounds, self.shapes.inradii, x0y0, candidates, rows)
+        exact = ~(miss | is_contact)
+        is_contact[exact] = intersects(self.shapes.vertices, self.shapes.offsets, x0y0, candidates[exact], rows)
+        contacts = candidates[is_contact]
+        unit_vector_rep, in_contact = repulsion(x0y0, contacts)
+        unit_vector_att = attraction(self.centers) if self.field is None else self.field.attraction(self.centers)
+        d_xy = np.where(in_contact[:n, np.newaxis],
+                        rep * unit_vector_rep[:n],
+                        att * unit_vector_att)
+        self.centers += d_xy
+        self.migrate()
+        i, j = contacts[:, 0], contacts[:, 1]  # i < j, so i is an own polygon
+        return int(np.sum((j < n) | (ids[i] < ids[j])))
+
+    def migrate(self):
+        """Send the own polygons that left the strip to the neighbours, receive theirs.
+        Returns the number of polygons sent.
+        """
+        x = self.centers[:, 0]
+        leaving = dict(left=x < self.lo, right=x >= self.hi)
+        outgoing = {side: self._message(leaving[side]) for side in leaving}
+        stay = ~(leaving['left'] | leaving['right'])
+        self.ids, self.centers = self.ids[stay], self.centers[stay]
+        for side, message in self._exchange(outgoing).items():
+            self.shapes.add(*message['shapes'])
+            self.ids = np.concatenate([self.ids, message['ids']])
+            self.centers = np.concatenate([self.centers, message['centers']])
+        return len(x)-int(np.sum(stay))
+
+
+class ShapeStore:
+    """Shapes (in the local frame) by global id, with the per-shape quantities that
+    PolyPacker keeps (bounding radius, bounding box, inscribed radius, convexity).
+    """
+
+    def __init__(self):
+        self._ids = np.empty(0, dtype=int)  # global id of each row
+        self._rows = {}  # global id -> row
+        self._vertices_buf = np.empty((0, 2), dtype=float)
+        self._offsets_buf = np.zeros(1, dtype=int)
+        self._radii_buf = np.empty(0, dtype=float)
+        self._bounds_buf = np.empty((0, 4), dtype=float)
+        self._inradii_buf = np.empty(0, dtype=float)
+        self._convex_buf = np.empty(0, dtype=bool)
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def vertices(self):
+        return self._vertices_buf[:self._offsets_buf[len(self)]]
+
+    @property
+    def offsets(self):
+        return self._offsets_buf[:len(self)+1]
+
+    @property
+    def radii(self):
+        return self._radii_buf[:len(self)]
+
+    @property
+    def bounds(self):
+        return self._bounds_buf[:len(self)]
+
+    @property
+    def inradii(self):
+        return self._inradii_buf[:len(self)]
+
+    @property
+    def convex(self):
+        return self._convex_buf[:len(self)]
+
+    def rows(self, ids):
+        """Row of each of the ids (which must be known)."""
+        return np.fromiter((self._rows[i] for i in ids.tolist()), dtype=int, count=len(ids))
+
+    def get(self, ids):
+        """Vertex buffer of the shapes ids."""
+        return take(self.vertices, self.offsets, self.rows(ids))
+
+    def add(self, ids, vertices, offsets):
+        """Add the shapes ids (a vertex buffer), skipping those already known."""
+        new = np.fromiter((i not in self._rows for i in ids.tolist()), dtype=bool, count=len(ids))
+        if not np.any(new):
+            return
+        ids = ids[new]
+        vertices, offsets = take(vertices, offsets, np.flatnonzero(new))
+        n0, m0 = len(self), self._offsets_buf[len(self)]
+        n1, m1 = n0+len(ids), m0+len(vertices)
+        self._ids = _reserve(self._ids, n1)
+        self._vertices_buf = _reserve(self._vertices_buf, m1)
+        self._offsets_buf = _reserve(self._offsets_buf, n1+1)
+        self._radii_buf = _reserve(self._radii_buf, n1)
+        self._bounds_buf = _reserve(self._bounds_buf, n1)
+        self._inradii_buf = _reserve(self._inradii_buf, n1)
+        self._convex_buf = _reserve(self._convex_buf, n1)
+        self._ids[n0:n1] = ids
+        self._vertices_buf[m0:m1] = vertices
+        self._offsets_buf[n0+1:n1+1] = m0+offsets[1:]
+        self._radii_buf[n0:n1] = maxradii(vertices, offsets)
+        self._bounds_buf[n0:n1] = bounds(vertices, offsets)
+        self._inradii_buf[n0:n1] = inradii(vertices, offsets)
+        self._convex_buf[n0:n1] = is_convex(vertices, offsets)
+        self._rows.update(zip(ids.tolist(), range(n0, n1)))
+
+    def compact(self, ids):
+        """Only keep the shapes ids."""
+        vertices, offsets = self.get(ids)
+        self.__init__()
+        self.add(ids, vertices, offsets)
+
+
+class Channel:
+    """Bidirectional channel for messages (picklable objects, e.g. dicts of arrays).
+    Wraps a multiprocessing Connection: one end of a local pipe (see pipe), or of a
+    socket from multiprocessing.connection.Client/Listener, e.g. to another node.
+    Counts the bytes sent and received.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.sent = 0
+        self.received = 0
+
+    @classmethod
+    def pipe(cls):
+        """Both ends of a local pipe."""
+        a, b = multiprocessing.Pipe()
+        return cls(a), cls(b)
+
+    def send(self, message):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.send_bytes(data)
+        self.sent += len(data)
+
+    def recv(self):
+        data = self.connection.recv_bytes()
+        self.received += len(data)
+        return pickle.loads(data)
+
+    def close(self):
+        self.connection.close()
+
+
+def _serve(domain, control, left=None, right=None):
+    """Worker: run the commands received over the control channel on the domain.
+    The channels to the neighbouring strips (None at the outer edges) may be any Channel.
+    """
+    domain.neighbours.update(left=left, right=right)
+    while True:
+        command, args = control.recv()
+        if command == 'close':
+            break
+        try:
+            if command == 'step':
+                result = domain.step(*args)
+            elif command == 'migrate':
+                result = domain.migrate()
+            elif command == 'edges':
+                edges, = args
+                domain.lo, domain.hi = edges[domain.rank], edges[domain.rank+1]
+                result = None
+            elif command == 'positions':
+                result = domain.centers
+            elif command == 'centers':
+                result = (domain.ids, domain.centers)
+            elif command == 'count':
+                result = len(domain.ids)
+            else:
+                raise Exception('unknown command {}'.format(command))
+        except Exception as error:
+            result = error
+        control.send(result)
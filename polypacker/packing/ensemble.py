@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .collision import intersects
+from .distances import broadphase
+from .forces import attraction, repulsion
+from .geometry import unragged, translated
+
+
+class Ensemble:
+    """Pack K independent replicas of the same population of polygons at once.
+    The shapes (local vertices and radii) are taken from a PolyPacker and shared by
+    all replicas, only the centres are stacked as (K, N, 2). Each step runs a single
+    broad phase, narrow phase and force computation over all active replicas.
+    """
+
+    def __init__(self, packer, K, shuffle=True, seed=None, jitter=0, positions=None):
+        """Initialise K replicas from the polygons (and centres) of the packer.
+        With shuffle, each replica randomly permutes which polygon starts at which of
+        the packer's centres. This only varies the assignment of one set of positions,
+        so for statistically independent replicas, either displace each centre randomly
+        by up to jitter in x and y, or pass positions, a function (k, rng) that returns
+        the centres (N, 2) of replica k (e.g. drawn from rng), instead of the packer's.
+        """
+        vertices, offsets = packer.get_vertices('local')
+        self._vertices = vertices.copy()
+        self._offsets = offsets.copy()
+        self._radii = packer._radii.copy()
+        self.K, self.N = K, packer.N
+        rng = np.random.default_rng(seed)
+        self.centers = np.repeat(packer.centers[np.newaxis], K, axis=0)  # (K, N, 2)
+        for k in range(K):
+            if positions is not None:
+                self.centers[k] = positions(k, rng)
+            if shuffle:
+                self.centers[k] = self.centers[k, rng.permutation(self.N)]
+        if jitter:
+            self.centers += rng.uniform(-jitter, jitter, self.centers.shape)
+        # per-replica convergence
+        self.iterations = np.zeros(K, dtype=int)  # number of steps taken
+        self.collisions = np.zeros(K, dtype=int)  # number of contacts after the last step
+        self.converged = np.zeros(K, dtype=bool)
+        self.att = np.zeros(K)  # step sizes of the last run
+        self.rep = np.zeros(K)
+
+    # ============================== #
+    #            Polygons            #
+    # ============================== #
+
+    def get_vertices(self, k, FoR='global'):
+        """Get the vertex buffer of replica k (see PolyPacker.get_vertices)."""
+        if FoR == 'global':
+            return translated(self._vertices, self._offsets, self.centers[k]), self._offsets
+        elif FoR == 'local':
+            return self._vertices, self._offsets
+        else:
+            raise Exception('invalid frame of reference (FoR)')
+
+    def get_polygons(self, k, FoR='global'):
+        """Return all polygons of replica k in the appropriate Frame-of-Reference."""
+        return list(unragged(*self.get_vertices(k, FoR=FoR)))
+
+    # ============================== #
+    #             Update             #
+    # ============================== #
+
+    def find_contacts(self, replicas=None):
+        """Find all intersecting pairs of polygons in the given replicas (default: all).
+        Returns the contacts as indices (k, i, j) of replica k's polygons i < j.
+        """
+        replicas = np.arange(self.K) if replicas is None else np.unique(replicas)
+        x0y0 = self.centers[replicas].reshape((-1, 2))
+        groups = np.repeat(np.arange(len(replicas)), self.N)  # position in replicas
+        shapes = np.tile(np.arange(self.N), len(replicas))
+        candidates = broadphase(x0y0, self._radii[shapes], groups=groups)
+        contacts = candidates[intersects(self._vertices, self._offsets, x0y0, candidates, shapes=shapes)]
+        return np.column_stack([replicas[contacts[:, 0]//self.N], contacts % self.N])
+
+    def step(self, att=0, rep=0, replicas=None):
+        """Update positions of polygons in the given replicas (default: all).
+        Same as PolyPacker.step, vectorised over the replicas. The step sizes att and
+        rep are either shared or given per replica (in the order of replicas).
+        Returns the number of contacts of each of the replicas.
+        """
+        replicas = np.arange(self.K) if replicas is None else np.unique(replicas)
+        contacts = self.find_contacts(replicas)
+        # index the stacked replicas by their position in replicas
+        position = np.searchsorted(replicas, contacts[:, 0])
+        pairs = position[:, np.newaxis]*self.N + contacts[:, 1:]
+        x0y0 = self.centers[replicas].reshape((-1, 2))
+        unit_vector_rep, in_contact = repulsion(x0y0, pairs)
+        unit_vector_att = attraction(x0y0)
+        att = np.repeat(np.broadcast_to(att, len(replicas)), self.N)[:, np.newaxis]  # per polygon
+        rep = np.repeat(np.broadcast_to(rep, len(replicas)), self.N)[:, np.newaxis]
+        d_xy = np.where(in_contact[:, np.newaxis],
+                        rep * unit_vector_rep,
+                        att * unit_vector_att)
+        self.centers[replicas] += d_xy.reshape((len(replicas), self.N, 2))
+        self.iterations[replicas] += 1
+        collisions = np.bincount(position, minlength=len(replicas))
+        self.collisions[replicas] = collisions
+        return collisions
+
+    def run(self, nsteps, att=0, rep=0, tol=1e-3, patience=10, anneal=0.5, min_step=None, workers=None):
+        """Step all replicas until they converge or nsteps are reached.
+        Each replica adapts its step sizes like PolyPacker.run: once it stalls for
+        patience steps, its step sizes are multiplied by anneal. It stalls while its
+        number of collisions does not fall and the root-mean-square distance of its
+        centres from the origin does not fall by a fraction tol. It has converged when
+        its step sizes would fall below min_step (default: 1/100 of the initial ones),
+        or when it stalls again right after annealing. Converged replicas are no longer
+        stepped (see collisions for their remaining number of contacts, att and rep
+        for their final step sizes).
+        Optionally, distribute the replicas over a number of worker processes.
+        Returns the converged flags.
+        """
+        min_step = min_step if min_step is not None else max(att, rep)/100
+        if workers is not None and workers > 1 and self.K > 1:
+            return self._run_parallel(nsteps, att, rep, tol, patience, anneal, min_step, workers)
+        self.att, self.rep = np.full(self.K, float(att)), np.full(self.K, float(rep))
+        best, least = np.full(self.K, np.inf), np.full(self.K, np.inf)  # fewest collisions, least rms
+        stalled, progressed = np.zeros(self.K, dtype=int), np.ones(self.K, dtype=bool)
+        for _ in range(nsteps):
+            active = np.flatnonzero(~self.converged)
+            if len(active) == 0:
+                break
+            collisions = self.step(self.att[active], self.rep[active], replicas=active)
+            rms = np.sqrt(np.mean(np.sum(self.centers[active]**2, axis=2), axis=1))
+            # adapt the step sizes of the stalled replicas, or stop them
+            closer = rms < least[active]*(1-tol)
+            least[active[closer]] = rms[closer]
+            progress = (collisions < best[active]) | closer
+            best[active] = np.minimum(best[active], collisions)
+            stalled[active] = np.where(progress, 0, stalled[active]+1)
+            progressed[active] |= progress
+            stall = stalled[active] >= patience
+            replica = active[stall]
+            done = ~progressed[replica] | (np.maximum(self.att[replica], self.rep[replica])*anneal < min_step)
+            self.converged[replica[done]] = True
+            annealed = replica[~done]
+            self.att[annealed] *= anneal
+            self.rep[annealed] *= anneal
+            best[annealed], least[annealed] = collisions[stall][~done], rms[stall][~done]
+            stalled[annealed], progressed[annealed] = 0, False
+        return self.converged
+
+    def _run_parallel(self, nsteps, att, rep, tol, patience, anneal, min_step, workers):
+        """Run groups of replicas in separate processes and gather the results."""
+        groups = np.array_split(np.arange(self.K), min(workers, self.K))
+        with ProcessPoolExecutor(len(groups)) as pool:
+            futures = [pool.submit(_run_subset, self.subset(g), nsteps, att, rep, tol, patience, anneal, min_step)
+                       for g in groups]
+            for g, future in zip(groups, futures):
+                sub = future.result()
+                self.centers[g] = sub.centers
+                self.iterations[g] = sub.iterations
+                self.collisions[g] = sub.collisions
+                self.converged[g] = sub.converged
+                self.att[g], self.rep[g] = sub.att, sub.rep
+        return self.converged
+
+    def subset(self, replicas):
+        """Create an ensemble of the given replicas (sharing the shapes)."""
+        sub = object.__new__(Ensemble)
+        sub.__dict__.update(self.__dict__)
+        sub.K = len(replicas)
+        for name in ('centers', 'iterations', 'collisions', 'converged', 'att', 'rep'):
+            setattr(sub, name, getattr(self, name)[replicas].copy())
+        return sub
+
+
+def _run_subset(ensemble, *args):
+    """Worker task: run an ensemble and return it."""
+    ensemble.run(*args)
+    return ensemble
@@ -0,0 +1,114 @@
+import numpy as np
+import shapely
+
+from .distances import minimum_image, normalize
+
+
+def scatter_add(indices, values, n):
+    """Sum the rows of values (M, D) into n bins given by indices.
+    Same result as np.add.at, but much faster through np.bincount.
+    """
+    summed = np.zeros((n, values.shape[1]), dtype=float)
+    for k in range(values.shape[1]):
+        summed[:, k] = np.bincount(indices, weights=values[:, k], minlength=n)
+    return summed
+
+
+def repulsion(x0y0, contacts, box=None):
+    """Compute the direction of repulsion of each object from its contacts.
+    Sums the unit vectors pointing away from each contacting object, touching
+    only the contacting pairs, and normalises the result. In a periodic box,
+    the directions are those of the minimum images.
+    Returns the unit vectors and a mask of objects with at least one contact.
+    """
+    n = len(x0y0)
+    i, j = contacts[:, 0], contacts[:, 1]
+    unit = normalize(minimum_image(x0y0[j]-x0y0[i], box), axis=1)  # from i towards j
+    usum = scatter_add(np.concatenate([j, i]), np.concatenate([unit, -unit]), n)
+    in_contact = np.zeros(n, dtype=bool)
+    in_contact[i] = True
+    in_contact[j] = True
+    return normalize(usum, axis=1), in_contact
+
+
+def separation(x0y0, contacts, normal, depth, clearance=0):
+    """Compute the displacement that separates each object from its contacts.
+    Each contact pushes both of its objects apart by half of its penetration depth
+    (plus half of the clearance) along the normal, which points from i towards j.
+    Returns the displacements and a mask of objects with any contact of unknown depth (NaN).
+    """
+    n = len(x0y0)
+    i, j = contacts[:, 0], contacts[:, 1]
+    known = np.isfinite(depth)
+    push = np.where(known[:, np.newaxis], normal*(depth[:, np.newaxis]+clearance)/2, 0)
+    d_xy = scatter_add(np.concatenate([j, i]), np.concatenate([push, -push]), n)
+    unknown = np.zeros(n, dtype=bool)
+    unknown[i[~known]] = True
+    unknown[j[~known]] = True
+    return d_xy, unknown
+
+
+def attraction(x0y0):
+    """Compute the direction of attraction of each object (towards the origin)."""
+    return normalize(-x0y0, axis=1)
+
+
+class DistanceField:
+    """Signed distance to the boundary of a region (negative inside), on a grid.
+    The field and its gradient are computed once, so sampling them at many points
+    (see sample and attraction) only takes a few array lookups per point.
+    """
+
+    def __init__(self, region, resolution=None, margin=None):
+        """Compute the field on a grid with spacing resolution (default: 1/128 of the
+        larger extent of the region) that covers the region's bounds plus a margin
+        (default: 8 grid cells).
+        """
+        x0, y0, x1, y1 = region.bounds
+        h = resolution or max(x1-x0, y1-y0)/128
+        margin = margin if margin is not None else 8*h
+        nx, ny = int(np.ceil((x1-x0+2*margin)/h))+1, int(np.ceil((y1-y0+2*margin)/h))+1
+        x = x0-margin + h*np.arange(nx)
+        y = y0-margin + h*np.arange(ny)
+        X, Y = np.meshgrid(x, y, indexing='ij')
+        shapely.prepare(region)
+        inside = shapely.contains_xy(region, X, Y)
+        distance = shapely.distance(region.boundary, shapely.points(X, Y))
+        values = np.where(inside, -distance, distance)
+        self.region = region
+        self.resolution = h
+        self.origin = np.array([x[0], y[0]])  # first grid point
+        self._grid = np.dstack([values, *np.gradient(values, h)])  # (nx, ny, 3): value, d/dx, d/dy
+
+    def sample(self, xy):
+        """Interpolate (bilinearly) the field and its gradient at the points xy (M, 2).
+        Points beyond the grid take the values at its nearest edge.
+        Returns the values (M,) and gradients (M, 2).
+        """
+        n = np.array(self._grid.shape[:2])
+        u = np.clip((xy-self.origin)/self.resolution, 0, n-1)  # in grid cells
+        ij = np.minimum(np.floor(u).astype(int), n-2)
+        f = u-ij
+        i, j = ij[:, 0], ij[:, 1]
+        fx, fy = f[:, 0:1], f[:, 1:2]
+        g = self._grid
+        sampled = (g[i, j]*(1-fx)*(1-fy) + g[i+1, j]*fx*(1-fy) +
+                   g[i, j+1]*(1-fx)*fy + g[i+1, j+1]*fx*fy)
+        return sampled[:, 0], sampled[:, 1:]
+
+    def attraction(self, xy):
+        """Compute the direction of attraction of each point into the region.
+        Points descend the field, i.e. move into the region along the shortest path
+        and then away from its boundary, which fills each lobe of a non-convex region.
+        Points beyond the grid follow the gradient at its nearest edge.
+        """
+        _, gradient = self.sample(xy)
+        return normalize(-gradient, axis=1)
+
+
+def compression(box, att, floor=0):
+    """Scale factor of a periodic box (and the positions in it) under uniform pressure.
+    The box shrinks such that its shortest edges move inwards by att each, but not
+    below the length floor.
+    """
+    return max(1 - 2*att/np.min(box), min(floor/np.min(box), 1))
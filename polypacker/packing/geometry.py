@@ -0,0 +1,158 @@
+import numpy as np
+import shapely
+
+
+def ragged(polygons):
+    """Pack the exteriors of polygons into a single vertex buffer.
+    Returns the vertices (M, 2) and the offsets (N+1,), such that polygon i
+    has the vertices[offsets[i]:offsets[i+1]]. Rings are stored open, i.e.
+    without repeating the first vertex at the end. Interior rings (holes) are ignored.
+    """
+    rings = shapely.get_exterior_ring(np.asarray(polygons, dtype=object))
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    counts = np.bincount(ring_index, minlength=len(rings))
+    is_closing = np.zeros(len(coords), dtype=bool)
+    is_closing[np.cumsum(counts)[counts > 0]-1] = True  # last coordinate of each ring
+    vertices = np.ascontiguousarray(coords[~is_closing], dtype=float)
+    offsets = np.concatenate([[0], np.cumsum(counts-(counts > 0))])
+    return vertices, offsets
+
+
+def as_vertices(polygons):
+    """Return the vertex buffer (vertices, offsets) of polygons, which are either a
+    sequence of shapely.geometry.Polygon objects or already a vertex buffer.
+    """
+    if isinstance(polygons, tuple) and len(polygons) == 2 and isinstance(polygons[0], np.ndarray):
+        return polygons
+    return ragged(polygons)  # exterior vertices of all polygons
+
+
+def unragged(vertices, offsets):
+    """Build polygons from a vertex buffer (see ragged).
+    Returns a geometry array of shapely.geometry.Polygon objects.
+    """
+    counts = np.diff(offsets)
+    rings = shapely.linearrings(vertices, indices=np.repeat(np.arange(len(counts)), counts))
+    return shapely.polygons(rings)
+
+
+def split(vertices, offsets):
+    """Split a vertex buffer into a list of (n_i, 2) views, one per polygon."""
+    return np.split(vertices, offsets[1:-1])
+
+
+def take(vertices, offsets, idx):
+    """Select the polygons idx of a vertex buffer.
+    Returns a new vertex buffer with its offsets.
+    """
+    rows, new_offsets = vertex_rows(offsets, idx)
+    return vertices[rows], new_offsets
+
+
+def vertex_rows(offsets, idx):
+    """Indices of the vertices of the polygons idx in a vertex buffer.
+    Returns the indices and the offsets of the polygons within them.
+    """
+    counts = np.diff(offsets)[idx]
+    new_offsets = np.concatenate([[0], np.cumsum(counts)])
+    rows = np.repeat(offsets[idx]-new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+    return rows, new_offsets
+
+
+def next_vertex(offsets):
+    """Index of the next vertex (cyclic within each polygon) of a vertex buffer."""
+    nxt = np.arange(1, offsets[-1]+1)
+    nxt[offsets[1:]-1] = offsets[:-1]  # last vertex wraps around to the first
+    return nxt
+
+
+def areas(vertices, offsets):
+    """Compute the area of each polygon with the shoelace formula (N,)."""
+    nxt = vertices[next_vertex(offsets)]
+    cross = vertices[:, 0]*nxt[:, 1] - vertices[:, 1]*nxt[:, 0]
+    return np.abs(np.add.reduceat(cross, offsets[:-1]))/2
+
+
+def bounds(vertices, offsets):
+    """Compute the bounds (xmin, ymin, xmax, ymax) of each polygon (N, 4)."""
+    starts = offsets[:-1]
+    lower = np.minimum.reduceat(vertices, starts, axis=0)
+    upper = np.maximum.reduceat(vertices, starts, axis=0)
+    return np.hstack([lower, upper])
+
+
+def midpoints(vertices, offsets):
+    """Compute the mid-point between bounds of each polygon (N, 2).
+    See distances.midpoint for why this is not the centroid.
+    """
+    x0y0x1y1 = bounds(vertices, offsets)
+    return (x0y0x1y1[:, :2]+x0y0x1y1[:, 2:])/2
+
+
+def translated(vertices, offsets, x0y0):
+    """Translate each polygon i of a vertex buffer by x0y0[i]."""
+    return vertices + np.repeat(x0y0, np.diff(offsets), axis=0)
+
+
+def decimate(vertices, offsets, max_vertices):
+    """Subsample each polygon of a vertex buffer to at most max_vertices (at least 3)
+    evenly spaced vertices. Returns a new vertex buffer with its offsets.
+    """
+    counts = np.diff(offsets)
+    kept = np.minimum(counts, max(max_vertices, 3))
+    new_offsets = np.concatenate([[0], np.cumsum(kept)])
+    j = np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1], kept)  # index within polygon
+    rows = np.repeat(offsets[:-1], kept) + j*np.repeat(counts, kept)//np.repeat(kept, kept)
+    return vertices[rows], new_offsets
+
+
+def rotated(vertices, offsets, angles):
+    """Rotate each polygon i of a vertex buffer by angles[i] (radians) about the origin."""
+    angles = np.repeat(angles, np.diff(offsets))
+    c, s = np.cos(angles), np.sin(angles)
+    x, y = vertices[:, 0], vertices[:, 1]
+    return np.column_stack([c*x-s*y, s*x+c*y])
+
+
+def orientation_table(vertices, bins):
+    """Rotate vertices (about the origin) to each of bins evenly spaced orientations.
+    Returns the table (M, bins, 2), where [k, b] is vertex k rotated by 2*pi*b/bins.
+    """
+    angles = 2*np.pi*np.arange(bins)/bins
+    c, s = np.cos(angles), np.sin(angles)
+    x, y = vertices[:, 0:1], vertices[:, 1:2]
+    return np.stack([c*x-s*y, s*x+c*y], axis=-1)
+
+
+def periodic_clip(vertices, offsets, box):
+    """Clip polygons to a periodic box (Lx, Ly) centred at the origin.
+    The parts of a polygon that stick out of the box are wrapped around, i.e. each
+    polygon becomes one or more parts, which together tile the plane.
+    Returns the vertex buffer of the parts and the index of the polygon of each part.
+    """
+    x0y0x1y1 = bounds(vertices, offsets)
+    lower, upper = x0y0x1y1[:, :2], x0y0x1y1[:, 2:]
+    owners, shifts = [], []
+    for shift in np.ndindex(3, 3):
+        shift = np.array(shift)-1  # image shifted by -1, 0 or +1 box sizes
+        needed = np.all((shift == 0) | ((shift < 0) & (upper > box/2)) | ((shift > 0) & (lower < -box/2)), axis=1)
+        owners.append(np.flatnonzero(needed))
+        shifts.append(np.tile(shift*box, (np.sum(needed), 1)))
+    owner, shift = np.concatenate(owners), np.concatenate(shifts)
+    images_v, images_o = take(vertices, offsets, owner)
+    images = unragged(translated(images_v, images_o, shift), images_o)
+    parts, index = shapely.get_parts(shapely.intersection(images, shapely.box(*-box/2, *box/2)), return_index=True)
+    is_polygon = (shapely.get_type_id(parts) == 3) & (shapely.area(parts) > 0)  # drop touching lines/points
+    order = np.argsort(owner[index[is_polygon]], kind='stable')
+    parts, owner = parts[is_polygon][order], owner[index[is_polygon]][order]
+    return (*ragged(parts), owner)
+
+
+def convex_hulls(vertices, offsets, max_vertices=None):
+    """Compute the convex hull of each polygon of a vertex buffer.
+    Optionally, subsample each hull to at most max_vertices vertices (see decimate),
+    which keeps it convex but may cut off some of the polygon.
+    Returns a new vertex buffer with its offsets.
+    """
+    hulls = ragged(shapely.convex_hull(unragged(vertices, offsets)))
+    return hulls if max_vertices is None else decimate(*hulls, max_vertices)
@@ -0,0 +1,61 @@
+import numpy as np
+
+from .distances import broadphase, minimum_image
+
+
+class NeighbourList:
+    """Verlet neighbour list that is reused across steps.
+    The list holds all pairs whose bounding circles are within a skin distance.
+    It stays valid as long as no object has moved more than half the skin since it
+    was built, because no pair can then have closed the gap of skin.
+    If only some objects are active, the list only holds pairs involving an active
+    object, so it is rebuilt when an object becomes active.
+    In a periodic box, a change of the box size counts as a displacement.
+    """
+
+    def __init__(self, skin=0):
+        self.skin = skin  # extra distance to include in the list (>=0)
+        self.rebuilds = 0  # number of times the list was built
+        self.reuses = 0  # number of times the list was reused
+        self.invalidate()
+
+    def invalidate(self):
+        """Force a rebuild on the next call."""
+        self._pairs = None
+        self._x0y0 = None  # centres when the list was built
+        self._active = None  # active objects when the list was built (None = all)
+        self._box = None  # periodic box when the list was built
+
+    def needs_rebuild(self, x0y0, active=None, box=None):
+        """Check whether the list is invalid for the centres x0y0 (and active objects)."""
+        if self._pairs is None or len(x0y0) != len(self._x0y0):
+            return True
+        if self._active is not None and (active is None or np.any(active & ~self._active)):
+            return True
+        if (box is None) != (self._box is None):
+            return True
+        displacement = np.sqrt(np.max(np.sum(minimum_image(x0y0-self._x0y0, box)**2, axis=1), initial=0))
+        if box is not None:  # periodic images move with the box size
+            displacement += np.max(np.abs(box-self._box))
+        return displacement > self.skin/2
+
+    def candidates(self, x0y0, radii, active=None, box=None):
+        """Find candidate pairs whose bounding circles overlap (see distances.broadphase).
+        Rebuilds the list only if needed, otherwise just filters the listed pairs.
+        Optionally, only return pairs involving at least one active object (boolean mask).
+        Optionally, use minimum image distances in a periodic box (Lx, Ly).
+        """
+        if self.needs_rebuild(x0y0, active, box):
+            self._pairs = broadphase(x0y0, radii+self.skin/2, active=active, box=box)  # within radii+skin
+            self._x0y0 = x0y0.copy()
+            self._active = None if active is None else active.copy()
+            self._box = None if box is None else box.copy()
+            self.rebuilds += 1
+        else:
+            self.reuses += 1
+        pairs = self._pairs
+        if active is not None:
+            pairs = pairs[active[pairs[:, 0]] | active[pairs[:, 1]]]
+        i, j = pairs[:, 0], pairs[:, 1]
+        distances = np.sqrt(np.sum(minimum_image(x0y0[i]-x0y0[j], box)**2, axis=1))
+        return pairs[distances <= radii[i]+radii[j]]
@@ -1,22 +1,69 @@
+from itertools import count
+import os
+
 import numpy as np
-from shapely.affinity import translate
+import shapely
 from shapely.geometry import Polygon
 
-from .distances import midpoint, normalize, pdist, mindist
+from .auxiliary import DensityMonitor
+from .checkpoint import CheckpointWriter, load_checkpoint, save_checkpoint
+from .distances import inradii, maxradii, minimum_image, pairs2matrix, wrap
+from .collision import circles, collide, cull, intersects, is_convex
+from .forces import DistanceField, attraction, compression, repulsion, separation
+from .geometry import areas, bounds, convex_hulls, ragged, unragged, midpoints, translated, orientation_table, vertex_rows
+from .neighbours import NeighbourList
+from .stats import Stats
+
+
+_versions = count()  # shape versions, unique across packers (e.g. sharing an executor)
 
 
 class PolyPacker:
 
-    def __init__(self, N=0):
+    def __init__(self, N=0, skin=0, executor=None, seed=None, stats=False, orientations=None, box=None):
         """Initialise PolyPacker object.
-        Use N to preallocate enough memory.
+        Use N to preallocate enough memory (the buffers grow as needed).
+        Use skin to reuse the candidate pairs across steps (see NeighbourList), e.g.
+        a few times the step size. The default of 0 finds them anew in each step.
+        Optionally, pass a ParallelExecutor to test the candidate pairs in parallel.
+        Use seed to make random decisions reproducible.
+        Use stats to record timers and counters of each step (see Stats).
+        Use orientations (a number of bins, e.g. 36 for 10 degrees) to let the polygons
+        rotate (see rotate). The vertices of every orientation are precomputed, which
+        needs orientations times the memory of the vertices.
+        Use box (Lx, Ly) for periodic boundary conditions in a box centred at the origin,
+        see step. The box must be at least four times the largest bounding radius (plus
+        twice the skin), so that no polygon can reach its own periodic image.
         """
-        self.centers = np.empty((N, 2), dtype=float)  # [(x,y)_0, (x,y)_1, ...]
-        self._polygons = np.empty(N, dtype=Polygon)
+        self._n = 0  # number of objects
+        # buffers with spare capacity (see _reserve), the valid part is exposed by properties
+        self._centers_buf = np.empty((N, 2), dtype=float)  # [(x,y)_0, (x,y)_1, ...]
+        # shapes in the local frame, as one vertex buffer (see geometry.ragged)
+        self._vertices_buf = np.empty((0, 2), dtype=float)  # [(x,y)_0, (x,y)_1, ...] of all objects
+        self._offsets_buf = np.zeros(N+1, dtype=int)  # object i has _vertices[_offsets[i]:_offsets[i+1]]
         # distance variables
-        M = N*(N-1)//2  # number of elements in triangular matrix (without main diagonal)
-        self._indices = np.empty((M, 2), dtype=int)
-        self._minimum_distance = np.empty(M, dtype=float)
+        self._radii_buf = np.empty(N, dtype=float)  # radius of each object's bounding circle
+        self._convex_buf = np.empty(N, dtype=bool)  # whether each object is convex
+        self._bounds_buf = np.empty((N, 4), dtype=float)  # bounding box (xmin, ymin, xmax, ymax) of each object
+        self._inradii_buf = np.empty(N, dtype=float)  # radius of each object's inscribed circle (about its centre)
+        # orientation, as a bin of the rotated vertices [(x,y)_0 at bin 0, 1, ...], [(x,y)_1 ...], ...
+        self.orientations = orientations  # number of bins (None = no rotation)
+        self._orientation_buf = np.zeros(N, dtype=int)
+        self._rotated_buf = np.empty((0, orientations or 0, 2), dtype=float)
+        self.box = None if box is None else np.array(box, dtype=float)  # periodic box (None = open)
+        self.field = None  # attraction into a region (None = towards the origin), see set_region
+        self.neighbours = NeighbourList(skin)  # broad phase
+        self.executor = executor  # narrow phase (None = serial)
+        self.stage = 'exact'  # resolution of the narrow phase, see run_stages
+        self.hull_vertices = 8  # at most, in stage 'hulls'
+        self._hulls = None  # (version, vertices, offsets) of the cached hulls
+        self._version = next(_versions)  # renewed whenever the shapes change
+        self._moves = 0  # incremented whenever the centres change
+        self._cache = {}  # name -> (versions, value) of the cached polygons, see _cached
+        self.rng = np.random.default_rng(seed)
+        self.iteration = 0  # number of steps taken
+        self.driver = {}  # parameters of the (last) run, to resume it
+        self.stats = Stats(enabled=stats)  # instrumentation
 
     def add_polygons(self, polygons):
         """Add polygons to the packer.
@@ -25,6 +72,9 @@ class PolyPacker:
             - instances of shapely.geometry.Polygon objects,
             - objects with .vertices property OR method that returns xy data, or
             - xy data (a sequence of (x,y) pairs)
+        For many polygons, add_vertices avoids creating a Polygon per object.
+        Only the exterior of each polygon is stored, so polygons with holes (interior
+        rings) are rejected.
         """
         # process different data types
         polys = []
@@ -40,106 +90,640 @@ class PolyPacker:
                     xy = poly
                 poly = Polygon(xy)  # construct the Polygon object
             polys.append(poly)
-        # split representation of each polygon into local polygon (shape) and center (position)
-        centers = [midpoint(p) for p in polys]
-        _polygons = [translate(p, -x0, -y0) for p, (x0, y0) in zip(polys, centers)]
-        self.centers = np.append(self.centers, centers, axis=0)
-        self._polygons = np.append(self._polygons, _polygons)
-        self.update_state()  # set internal state _minimum_distance, _indices
+        if len(polys) == 0:
+            return  # nothing to add
+        if np.any(shapely.get_num_interior_rings(np.asarray(polys, dtype=object)) > 0):
+            raise Exception('polygons with holes are not supported')
+        self.add_vertices(*ragged(polys))
+
+    def add_vertices(self, vertices, offsets):
+        """Add polygons given as a vertex buffer to the packer.
+        Provide the vertices (M, 2) in absolute coordinates and the offsets (N+1,),
+        such that polygon i has the vertices[offsets[i]:offsets[i+1]] (see geometry.ragged).
+        Rings may be open or closed (repeating the first vertex at the end).
+        """
+        vertices = np.asarray(vertices, dtype=float).reshape((-1, 2))
+        offsets = np.asarray(offsets, dtype=int)
+        if offsets[0] != 0 or offsets[-1] != len(vertices):
+            raise Exception('offsets must start at 0 and end at the number of vertices')
+        if len(offsets) < 2:
+            return  # nothing to add
+        # store rings open: drop the closing vertex
+        is_closing = np.zeros(len(vertices), dtype=bool)
+        last, first = offsets[1:]-1, offsets[:-1]
+        is_closing[last] = np.all(vertices[last] == vertices[first], axis=1) & (last > first)
+        if np.any(is_closing):
+            vertices = vertices[~is_closing]
+            offsets = offsets - np.concatenate([[0], np.cumsum(is_closing[last])])
+        if np.any(np.diff(offsets) < 3):
+            raise Exception('polygons need at least 3 vertices')
+        # split representation of each polygon into local vertices (shape) and center (position)
+        centers = midpoints(vertices, offsets)
+        vertices = translated(vertices, offsets, -centers)
+        self._append(vertices, offsets, centers)
+
+    def _append(self, vertices, offsets, centers):
+        """Append polygons (local vertex buffer and centres) to the buffers."""
+        # grow the buffers if necessary
+        n0, m0 = self.N, self._offsets[-1]
+        n1, m1 = n0+len(centers), m0+len(vertices)
+        self._centers_buf = _reserve(self._centers_buf, n1)
+        self._vertices_buf = _reserve(self._vertices_buf, m1)
+        self._offsets_buf = _reserve(self._offsets_buf, n1+1)
+        self._radii_buf = _reserve(self._radii_buf, n1)
+        self._convex_buf = _reserve(self._convex_buf, n1)
+        self._bounds_buf = _reserve(self._bounds_buf, n1)
+        self._inradii_buf = _reserve(self._inradii_buf, n1)
+        self._orientation_buf = _reserve(self._orientation_buf, n1)
+        self._centers_buf[n0:n1] = centers
+        self._vertices_buf[m0:m1] = vertices
+        self._orientation_buf[n0:n1] = 0  # the vertices as given
+        if self.orientations:
+            self._rotated_buf = _reserve(self._rotated_buf, m1)
+            self._rotated_buf[m0:m1] = orientation_table(vertices, self.orientations)
+        self._offsets_buf[n0+1:n1+1] = m0+offsets[1:]
+        self._n = n1
+        self.update_state(first=n0)  # set internal state _radii, _convex, ... of the new objects
 
     # ============================== #
     #            Polygons            #
     # ============================== #
 
+    def get_vertices(self, FoR='local'):
+        """Get the vertex buffer of all polygons in the appropriate Frame-of-Reference.
+        Returns the vertices and offsets, see geometry.ragged for the layout.
+        The local vertices are a view of the internal data, so do not modify them.
+        The global vertices are cached (see global_vertices).
+        """
+        if FoR == 'global':
+            return self.global_vertices()
+        elif FoR == 'local':
+            return self._vertices, self._offsets
+        else:
+            raise Exception('invalid frame of reference (FoR)')
+
     def get_polygon(self, idx, FoR='local'):
         """Get polygon in the appropriate Frame-of-Reference.
         By default, returns in the local frame to avoid translation.
         """
+        xy = self._vertices[self._offsets[idx]:self._offsets[idx+1]]
         if FoR == 'global':
-            return translate(self._polygons[idx], *self.centers[idx])
+            return Polygon(xy + self.centers[idx])
         elif FoR == 'local':
-            return self._polygons[idx]
+            return Polygon(xy)
         else:
             raise Exception('invalid frame of reference (FoR)')
 
     def get_polygons(self, FoR='local'):
         """Return all polygons in the appropriate Frame-of-Reference.
         By default, returns in the local frame to avoid translation.
+        The polygons are cached until the shapes (or, if global, the centres) change,
+        so repeated calls within an iteration return the same objects.
+        """
+        if FoR not in {'global', 'local'}:
+            raise Exception('invalid frame of reference (FoR)')
+        return list(self._cached('polygons_'+FoR, lambda: unragged(*self.get_vertices(FoR=FoR)), FoR == 'local'))
+
+    def global_vertices(self):
+        """Get the vertex buffer of all polygons in the global frame, without creating
+        any Shapely objects. The centres are added in one operation, and the result is
+        cached until the shapes or centres change. The vertices are read-only.
+        """
+        def translate():
+            vertices = translated(self._vertices, self._offsets, self.centers)
+            vertices.flags.writeable = False  # shared by all callers
+            return vertices
+        return self._cached('vertices_global', translate), self._offsets
+
+    def _cached(self, name, compute, local=False):
+        """Return the cached value of name, or compute it if the shapes (or, unless
+        local, the centres) have changed since.
         """
-        return [self.get_polygon(i, FoR=FoR) for i in range(self.N)]
+        versions = (self._version, None if local else self._moves)
+        cached = self._cache.get(name)
+        if cached is None or cached[0] != versions:
+            cached = self._cache[name] = (versions, compute())
+        return cached[1]
 
     @property
     def N(self):
-        return len(self._polygons)
+        return self._n
+
+    @property
+    def centers(self):
+        """Centre of each polygon. Assign (packer.centers = ...) instead of modifying
+        them in place, so that the cached polygons are updated (see global_vertices).
+        """
+        return self._centers_buf[:self._n]
+
+    @centers.setter
+    def centers(self, x0y0):
+        self._centers_buf[:self._n] = x0y0
+        self._moves += 1
 
-    # We are keeping the actual data (_polygons) private, because of Frame-of-Reference
+    @property
+    def orientation(self):
+        """Orientation bin of each polygon (see rotate)."""
+        return self._orientation_buf[:self._n]
+
+    @property
+    def angles(self):
+        """Rotation of each polygon (radians) relative to when it was added."""
+        return 2*np.pi*self.orientation/(self.orientations or 1)
+
+    @property
+    def _vertices(self):
+        return self._vertices_buf[:self._offsets_buf[self._n]]
+
+    @property
+    def _offsets(self):
+        return self._offsets_buf[:self._n+1]
+
+    @property
+    def _radii(self):
+        return self._radii_buf[:self._n]
+
+    @property
+    def _convex(self):
+        return self._convex_buf[:self._n]
+
+    @property
+    def _bounds(self):
+        return self._bounds_buf[:self._n]
+
+    @property
+    def _inradii(self):
+        return self._inradii_buf[:self._n]
+
+    # We are keeping the actual data (_vertices) private, because of Frame-of-Reference
     polygons = property(get_polygons)  # get method using default arguments
 
+    def packing_fraction(self):
+        """Total area of the polygons relative to the area of the periodic box.
+        Overlapping areas count twice. To export the polygons of a periodic box as a
+        tileable substrate, use write_polygons(..., box=packer.box).
+        """
+        if self.box is None:
+            raise Exception('packing fraction needs a periodic box')
+        return np.sum(areas(self._vertices, self._offsets))/np.prod(self.box)
+
+    def spread(self):
+        """Measure how far the polygons are spread out, which attraction reduces (see step).
+        This is the root-mean-square distance of the centres from the origin, or the mean
+        signed distance of the centres from the boundary of the region (see set_region)
+        plus the square root of its area (which keeps it positive), or the square root
+        of the area of the periodic box.
+        """
+        if self.field is not None:
+            distance, _ = self.field.sample(self.centers)
+            return np.mean(distance) + np.sqrt(self.field.region.area)
+        if self.box is not None:
+            return np.sqrt(np.prod(self.box))
+        return np.sqrt(np.mean(np.sum(self.centers**2, axis=1)))
+
     # ============================== #
     #            Distance            #
     # ============================== #
 
-    def update_state(self):
-        """Update the internal state.
-        When updating _polygons, the other internal variables need to be updated.
+    def update_state(self, first=0):
+        """Update the internal state of objects first, first+1, ..., N-1.
+        When updating _vertices, the other internal variables need to be updated.
+        Only per-object quantities are stored, pairs are resolved in the broad phase.
+        """
+        if first >= self.N:
+            return  # nothing to update
+        #NOTE: uses _vertices (internal, translated into local frame)!
+        vertices = self._vertices[self._offsets[first]:]
+        offsets = self._offsets[first:]-self._offsets[first]
+        self._radii_buf[first:self.N] = maxradii(vertices, offsets)  # bounding radius
+        self._convex_buf[first:self.N] = is_convex(vertices, offsets)
+        self._bounds_buf[first:self.N] = bounds(vertices, offsets)  # local frame
+        self._inradii_buf[first:self.N] = inradii(vertices, offsets)
+        self.neighbours.invalidate()
+        self._version = next(_versions)
+
+    def find_contacts(self, depth=False, active=None):
+        """Find all intersecting pairs of polygons.
+        Returns the sparse contact list as an array of indices (i, j) with i < j.
+        With depth=True, convex pairs are tested with the separating axis test, which
+        also returns the unit normal (pointing from i to j) and penetration depth of
+        each contact. Pairs involving a non-convex polygon have NaN normal and depth.
+        Optionally, only find contacts involving at least one active polygon (boolean mask).
+        In a periodic box, pairs are tested in their minimum image (see _images).
+        Before the exact test, pairs with disjoint bounding boxes are rejected and pairs
+        with overlapping inscribed circles are accepted (see collision.cull), which the
+        stats count as the tiers 'aabb', 'inscribed' and 'exact'.
+        Coarser stages (see run_stages) test the bounding circles ('circles') or the convex
+        hulls ('hulls') instead of the polygons, which gives the depth of every contact.
         """
-        # compute minimum clearance between objects
-        #NOTE: uses _polygons (internal, translated into local frame)!
-        self._minimum_distance, self._indices = mindist(self._polygons)
+        if self.stage != 'exact':
+            return self._find_coarse_contacts(depth, active)
+
+        # detect possible collisions based on spacing (broad phase)
+        t = self.stats.tic()
+        candidates = self.neighbours.candidates(self.centers, self._radii, active=active, box=self.box)
+        t = self.stats.toc('broad', t)
+
+        # check intersection of all candidates at once (narrow phase)
+        x0y0, shapes, pairs = self._images(candidates)
+        miss, hit = cull(self._bounds, self._inradii, x0y0, pairs, shapes)
+        nPairs = len(candidates)
+        is_contact = hit.copy()
+        if not depth:
+            exact = ~(miss | hit)
+            is_contact[exact] = self._intersects(pairs[exact], x0y0, shapes)
+            self.stats.toc('narrow', t)
+            self.stats.count(candidates=nPairs, contacts=np.sum(is_contact),
+                             aabb=np.sum(miss), inscribed=np.sum(hit), exact=np.sum(exact))
+            return candidates[is_contact]
+        normal = np.full((nPairs, 2), np.nan)
+        overlap = np.full(nPairs, np.nan)
+        convex = np.all(self._convex[candidates], axis=1)
+        hit &= ~convex  # convex hits still need their depth
+        sat = convex & ~miss
+        exact = ~(convex | miss | hit)
+        is_contact[sat], normal[sat], overlap[sat] = collide(self._vertices, self._offsets, x0y0, pairs[sat], shapes)
+        is_contact[exact] = self._intersects(pairs[exact], x0y0, shapes)
+        self.stats.toc('narrow', t)
+        self.stats.count(candidates=nPairs, contacts=np.sum(is_contact),
+                         aabb=np.sum(miss), inscribed=np.sum(hit), exact=np.sum(sat)+np.sum(exact))
+        return candidates[is_contact], normal[is_contact], overlap[is_contact]
 
-    def find_intersections(self):
+    def _find_coarse_contacts(self, depth, active):
+        """Find contacts between bounding circles or convex hulls (see find_contacts)."""
+        t = self.stats.tic()
+        candidates = self.neighbours.candidates(self.centers, self._radii, active=active, box=self.box)
+        t = self.stats.toc('broad', t)
+        if self.stage == 'circles':
+            is_contact, normal, overlap = circles(self.centers, self._radii, candidates, self.box)
+        elif self.stage == 'hulls':
+            x0y0, shapes, pairs = self._images(candidates)
+            hulls = self.get_hulls() if len(pairs) else (self._vertices, self._offsets)  # unused if no pairs
+            is_contact, normal, overlap = collide(*hulls, x0y0, pairs, shapes)
+        else:
+            raise Exception("stage must be 'circles', 'hulls' or 'exact'")
+        self.stats.toc('narrow', t)
+        self.stats.count(candidates=len(candidates), contacts=np.sum(is_contact))
+        if not depth:
+            return candidates[is_contact]
+        return candidates[is_contact], normal[is_contact], overlap[is_contact]
+
+    def get_hulls(self):
+        """Get the vertex buffer of the convex hulls (local frame, see geometry.convex_hulls).
+        The hulls have at most hull_vertices vertices and are cached until the shapes change.
+        """
+        if self._hulls is None or self._hulls[0] != (self._version, self.hull_vertices):
+            self._hulls = ((self._version, self.hull_vertices),
+                           *convex_hulls(self._vertices, self._offsets, self.hull_vertices))
+        return self._hulls[1:]
+
+    def _intersects(self, pairs, x0y0, shapes=None):
+        """Test pairs of polygons for intersection (see collision.intersects)."""
+        if self.executor is not None:
+            return self.executor.intersects(self._vertices, self._offsets, x0y0, pairs, shapes,
+                                            version=self._version)
+        return intersects(self._vertices, self._offsets, x0y0, pairs, shapes)
+
+    def _images(self, pairs):
+        """Place the pairs in their minimum image for the narrow phase.
+        Returns the centres, the shape of each object and the pairs to test. In a periodic
+        box, a pair (i, j) that is closest across a face is tested against a ghost copy of
+        j, shifted by the box size. Only polygons near a face get such ghosts.
+        """
+        if self.box is None:
+            return self.centers, None, pairs
+        i, j = pairs[:, 0], pairs[:, 1]
+        d_xy = self.centers[j]-self.centers[i]
+        shift = minimum_image(d_xy, self.box)-d_xy
+        across = np.any(shift != 0, axis=1)
+        if not np.any(across):
+            return self.centers, None, pairs
+        ghosts, inverse = np.unique(np.column_stack([j[across], shift[across]]), axis=0, return_inverse=True)
+        owner = ghosts[:, 0].astype(int)
+        x0y0 = np.concatenate([self.centers, self.centers[owner]+ghosts[:, 1:]])
+        shapes = np.concatenate([np.arange(self.N), owner])
+        pairs = pairs.copy()
+        pairs[across, 1] = self.N+inverse.reshape(-1)
+        return x0y0, shapes, pairs
+
+    def find_intersections(self, sparse=False):
         """Find all intersections between polygons.
         Returns the symmetric intersection matrix where
           [i,j] = True iff polygons i and j intersect.
+        The dense matrix is O(N^2), so prefer find_contacts (or sparse=True) for large N.
         """
+        return pairs2matrix(self.find_contacts(), self.N, sparse=sparse)
 
-        # compute objects' pairwise distances
-        distances = pdist(self.centers)
-
-        # detect possible collisions based on spacing
-        candidates = self._indices[distances <= self._minimum_distance]
+    # ============================== #
+    #            Rotation            #
+    # ============================== #
 
-        # check intersection and fill intersection matrix
-        nPolys = len(self.polygons)
-        intersection_matrix = np.zeros((nPolys, nPolys), dtype=bool)  #TODO: scipy.sparse?
-        for i, j in candidates:
-            # get polygons in their global position
-            poly_i = self.get_polygon(i, FoR='global')
-            poly_j = self.get_polygon(j, FoR='global')
-            # check for intersection
-            if poly_i.intersects(poly_j):  # did intersect
-                intersection_matrix[i, j] = True  # \__ symmetric
-                intersection_matrix[j, i] = True  # /
+    def rotate(self, idx, turns):
+        """Rotate the polygons idx (about their centre) by turns orientation bins.
+        The rotated vertices are looked up in the precomputed table, and the bounding
+        radius does not change, as it is measured from the centre.
+        """
+        if not self.orientations:
+            raise Exception('rotation needs orientations (see __init__)')
+        idx = np.asarray(idx, dtype=int).reshape(-1)
+        orientation = (self._orientation_buf[idx] + turns) % self.orientations
+        self._orientation_buf[idx] = orientation
+        rows, offsets = vertex_rows(self._offsets, idx)
+        self._vertices_buf[rows] = self._rotated_buf[rows, np.repeat(orientation, np.diff(offsets))]
+        self._bounds_buf[idx] = bounds(self._vertices_buf[rows], offsets)  # the inscribed radius does not change
+        self._version = next(_versions)
 
-        return intersection_matrix
+    def _rotation_trials(self, contacts, candidates, rot):
+        """Randomly rotate the candidate polygons (boolean mask) by up to rot radians.
+        A rotation is undone if the polygon then has more contacts than before.
+        """
+        idx = np.flatnonzero(candidates)
+        if len(idx) == 0:
+            return
+        max_turns = max(1, int(round(rot*self.orientations/(2*np.pi))))
+        turns = self.rng.integers(1, max_turns+1, len(idx)) * self.rng.choice([-1, 1], len(idx))
+        before = np.bincount(contacts.ravel(), minlength=self.N)[idx]
+        self.rotate(idx, turns)
+        with self.stats.uncounted():  # the step counts its own contacts only
+            after = np.bincount(self.find_contacts(active=candidates).ravel(), minlength=self.N)[idx]
+        worse = after > before
+        self.rotate(idx[worse], -turns[worse])
 
     # ============================== #
     #             Update             #
     # ============================== #
 
-    def step(self, att=0, rep=0):
+    def set_region(self, region, resolution=None):
+        """Attract the polygons into the region (a Shapely polygon) instead of towards
+        the origin. The signed distance field of the region is precomputed on a grid
+        with spacing resolution (see forces.DistanceField), so that each step only
+        samples it at the centres. Use None to attract towards the origin again.
+        """
+        if region is not None and self.box is not None:
+            raise Exception('a periodic box has no region to attract to')
+        self.field = None if region is None else DistanceField(region, resolution)
+
+    def step(self, att=0, rep=0, depth=False, active=None, rot=0):
         """Update positions of polygons.
-        Attract all non-overlapping polygons by att towards the origin,
-        while repelling all overlapping polygons by rep.
+        Attract all non-overlapping polygons by att towards the origin (or into the
+        region, see set_region), while repelling all overlapping polygons by rep.
+        In a periodic box, there is no centre to attract to. Instead, the box and all
+        positions are compressed uniformly (see forces.compression), such that the box
+        faces move by att times the fraction of non-overlapping polygons, and the centres
+        are wrapped back into the box. The compression thus stops once all are jammed, or
+        once the shortest edge of the box reaches the limit of the broad phase (four times
+        the largest bounding radius plus twice the skin). Below it, a polygon could also
+        overlap its own periodic image, which is never tested.
+        With depth=True, overlapping convex polygons are instead pushed apart by
+        their penetration depth (see find_contacts) plus a clearance of rep.
+        Optionally, only move the active polygons (boolean mask), the others are
+        only considered as obstacles to the active ones.
+        With rot, overlapping polygons also try a random rotation by up to rot radians,
+        which is kept unless it increases their number of contacts (see rotate).
+        Returns the contacts (see find_contacts).
         """
 
         # find intersections
-        intersection_matrix = self.find_intersections()
-        intersection_matrix = intersection_matrix[:, :, np.newaxis]  # reshape for broadcasting
+        if depth:
+            contacts, normal, overlap = self.find_contacts(depth=True, active=active)
+        else:
+            contacts = self.find_contacts(active=active)
 
         # repulsion
-        xy1 = np.reshape(self.centers, (1, -1, 2))
-        xy2 = np.reshape(xy1         , (-1, 1, 2))
-        Unorm = normalize(xy1-xy2, axis=2)  # unit vectors to others
-        Unorm = np.where(intersection_matrix, Unorm, 0)  # only intersections
-        Usum = np.sum(Unorm, axis=0, keepdims=False)  # sum contributions
-        unit_vector_rep = normalize(Usum, axis=1)
+        t = self.stats.tic()
+        unit_vector_rep, in_contact = repulsion(self.centers, contacts, self.box)
+        d_xy_rep = rep * unit_vector_rep
+        if depth:  # use the penetration depth where it is known
+            d_xy_sep, unknown = separation(self.centers, contacts, normal, overlap, clearance=rep)
+            d_xy_rep = np.where(unknown[:, np.newaxis], d_xy_rep, d_xy_sep)
 
-        # attraction
-        unit_vector_att = normalize(-self.centers, axis=1)
+        # attraction (or uniform compression of a periodic box)
+        if self.field is not None:
+            unit_vector_att = self.field.attraction(self.centers)
+        elif self.box is None:
+            unit_vector_att = attraction(self.centers)
+        else:
+            unit_vector_att = np.zeros_like(self.centers)
+            floor = 4*np.max(self._radii, initial=0) + 2*self.neighbours.skin  # see distances.broadphase
+            scale = compression(self.box, att*np.mean(~in_contact) if self.N else 0, floor)
+
+        # rotation
+        if rot:
+            self._rotation_trials(contacts, in_contact if active is None else in_contact & active, rot)
+            t = self.stats.tic()
 
         # compute change and apply
-        d_xy = np.where(np.any(intersection_matrix, axis=0),
-                        rep * unit_vector_rep,
+        d_xy = np.where(in_contact[:, np.newaxis],
+                        d_xy_rep,
                         att * unit_vector_att)
+        if active is not None:
+            d_xy[~active] = 0
+        t = self.stats.toc('forces', t)
         self.centers += d_xy
+        if self.box is not None:
+            self.box *= scale
+            self.centers = wrap(self.centers*scale, self.box)
+        self.iteration += 1
+        self.stats.toc('update', t)
+        if self.stats.enabled:
+            self.stats.count(moved=np.count_nonzero(np.any(d_xy != 0, axis=1)),
+                             active=self.N if active is None else np.sum(active))
+            self.stats.step()
+
+        return contacts
+
+    def run(self, nsteps, att, rep, *, depth=False, rot=0, region=None, ui=None,
+            anneal=0.5, patience=10, min_step=None, tol=1e-3, min_rate=None, freeze_after=None, freeze_tol=None,
+            checkpoint=None, checkpoint_every=100, background=False):
+        """Step until converged (at most nsteps times).
+        The step sizes att and rep (and the rotation rot, see step) are adapted: once the
+        polygons stall for patience iterations, all are multiplied by anneal. They stall
+        while the number of collisions does not fall, the spread (see spread) does not
+        fall by a fraction tol, and the density in the region does not rise by a fraction tol.
+        The run stops early when the step sizes would fall below min_step (default: 1/100 of
+        the initial ones), or when they stall again right after annealing.
+        With min_rate, the run also stops ('rate') once the step sizes have been annealed
+        and the collisions per polygon are at most min_rate (see run_stages).
+        With freeze_after, polygons that have settled are frozen: over the last freeze_after
+        iterations, their net displacement was at most freeze_tol per iteration (default: half
+        the current att, so freely attracted polygons never settle). Polygons that rattle in
+        a jammed core thus settle while others still move in. Frozen polygons are skipped in
+        the broad and narrow phase, until an active polygon newly collides with them (the
+        contacts they had when they froze do not wake them). Contacts between frozen polygons
+        are found once when they freeze, and still count as collisions.
+        The ui (see polypacker.ui) is updated with the polygons (as a vertex buffer), density
+        and collisions (and the stats snapshot, if enabled), and is checked for a stop request
+        in every iteration.
+        In a periodic box without a region, the density is the packing fraction of the box.
+        The region only serves to monitor the density, use set_region to attract into it.
+        With checkpoint (a file path), the state is saved every checkpoint_every iterations
+        and at the end (see save_checkpoint), optionally in a background thread. The
+        parameters to continue the run are kept in driver, so after load_checkpoint, use
+        packer.run(**packer.driver, region=region, ui=ui) to resume it.
+        Returns a dict with the history of the collisions and density, the final step
+        sizes, and the reason for stopping ('converged', 'rate', 'stopped' or 'nsteps').
+        """
+        monitor = DensityMonitor(self, region) if region is not None else None
+        min_step = min_step if min_step is not None else max(att, rep)/100
+        writer = CheckpointWriter(checkpoint, background) if checkpoint is not None else None
+        self.driver = dict(nsteps=nsteps, att=att, rep=rep, depth=depth, rot=rot, anneal=anneal, patience=patience,
+                           min_step=min_step, tol=tol, min_rate=min_rate, freeze_after=freeze_after, freeze_tol=freeze_tol,
+                           checkpoint=None if checkpoint is None else os.fspath(checkpoint),
+                           checkpoint_every=checkpoint_every, background=background)
+        freezing = freeze_after is not None
+        active = np.ones(self.N, dtype=bool)
+        anchor = self.centers.copy()  # position when last moved (or woken)
+        idle = np.zeros(self.N, dtype=int)  # iterations since the anchor
+        held = np.empty((0, 2), dtype=int)  # contacts of frozen polygons when they froze
+        history = dict(collisions=[], density=[], active=[])
+        best, least, densest = np.inf, np.inf, -np.inf  # fewest collisions, least spread, highest density
+        stalled, progressed = 0, True  # iterations without progress, progress since annealing
+        annealed = False
+        reason = 'nsteps'
+        for ITER in range(nsteps):
+
+            # step and monitor
+            masked = freezing and not np.all(active)  # the full search is faster
+            contacts = self.step(att, rep, depth=depth, active=active if masked else None, rot=rot)
+            collisions = len(contacts) + np.count_nonzero(~active[held[:, 0]] & ~active[held[:, 1]])
+            if monitor is not None:
+                density = monitor.update()
+            else:
+                density = self.packing_fraction() if self.box is not None else None
+            history['collisions'].append(collisions)
+            history['density'].append(density)
+            history['active'].append(int(np.sum(active)))
+
+            # active set: freeze idle polygons, wake those hit by active ones
+            if freezing:
+                tol_xy = (freeze_tol if freeze_tol is not None else att/2)*freeze_after  # net displacement
+                moved = np.sum(minimum_image(self.centers-anchor, self.box)**2, axis=1) > tol_xy**2
+                fresh = contacts[~np.isin(_pair_codes(contacts, self.N), _pair_codes(held, self.N))]
+                woken = np.zeros(self.N, dtype=bool)
+                woken[fresh.ravel()] = True
+                woken &= ~active
+                reset = moved | woken
+                anchor[reset] = self.centers[reset]
+                idle = np.where(reset, 0, idle+1)
+                freeze = active & (idle >= freeze_after)
+                active = woken | (active & ~freeze)
+                if np.any(freeze):  # their contacts are either no longer searched or should not wake them
+                    with self.stats.uncounted():
+                        touching = self.find_contacts(active=freeze)
+                    held = held[~freeze[held[:, 0]] & ~freeze[held[:, 1]]]  # replaced by their current contacts
+                    held = np.concatenate([held, np.sort(touching, axis=1)])
+                held = held[~active[held[:, 0]] | ~active[held[:, 1]]]
+
+            # ui
+            if ui is not None:
+                if ui.needs_update(ITER):
+                    stats = dict(stats=self.stats.snapshot()) if self.stats.enabled else {}
+                    ui.do_update(ITER, self.get_vertices('global'), density, collisions, **stats)
+                if ui.was_stopped:
+                    reason = 'stopped'
+                    break
+
+            # adapt step size or stop
+            if min_rate is not None and annealed and collisions <= min_rate*self.N:
+                reason = 'rate'
+                break
+            spread = self.spread()
+            progress = collisions < best  # the polygons still pack if any of these improves
+            if spread < least*(1-tol):
+                least, progress = spread, True
+            if density is not None and density > densest*(1+tol):
+                densest, progress = density, True
+            best = min(best, collisions)
+            stalled = 0 if progress else stalled+1
+            progressed |= progress
+            if stalled >= patience:
+                if not progressed or max(att, rep)*anneal < min_step:
+                    reason = 'converged'
+                    break
+                att, rep, rot = att*anneal, rep*anneal, rot*anneal
+                annealed = True
+                best, least, densest = collisions, spread, (density if density is not None else -np.inf)
+                stalled, progressed = 0, False
+                if freezing:  # step sizes changed, so re-evaluate all polygons
+                    active[:] = True
+                    held = held[:0]
+                    anchor, idle = self.centers.copy(), np.zeros(self.N, dtype=int)
+
+            # checkpoint
+            self.driver.update(nsteps=nsteps-ITER-1, att=att, rep=rep, rot=rot)
+            if writer is not None and (ITER+1) % checkpoint_every == 0:
+                writer.write(self)
+
+        if reason != 'nsteps':
+            self.driver.update(nsteps=0)  # nothing to resume
+        if writer is not None:
+            writer.write(self)
+            writer.wait()
+        history.update(iterations=len(history['collisions']), att=att, rep=rep, reason=reason)
+        return history
+
+    def run_stages(self, nsteps, att, rep, *, stages=('circles', 'hulls', 'exact'), min_rate=1.5,
+                   max_share=0.25, hull_vertices=8, **kwargs):
+        """Run (see run) from coarse to fine resolution, at most nsteps steps in total.
+        The stages first pack the bounding circles ('circles', without Shapely), then the
+        convex hulls with at most hull_vertices vertices ('hulls', with the separating axis
+        test), and finally the polygons themselves ('exact'). A coarse stage hands over once
+        the step sizes were annealed and the collisions per polygon (at the stage's
+        resolution) are at most min_rate, or after at most a share max_share of nsteps,
+        so that the final stage is not starved. Under attraction, even a converged packing
+        has contacts in every step, typically 0.5 to 1.5 per polygon, so min_rate should not be
+        much lower. The next stage continues from its centres, but
+        restarts with the initial step sizes (the coarse stages anneal them too early to
+        be useful for the finer ones). The kwargs are passed to run (e.g. depth, region or ui).
+        Returns the history of each stage as a list of (stage, history).
+        """
+        kwargs.setdefault('min_step', max(att, rep)/100)  # relative to the initial step sizes
+        self.hull_vertices = hull_vertices
+        histories, total = [], nsteps
+        try:
+            for k, stage in enumerate(stages):
+                self.stage = stage
+                last = k == len(stages)-1
+                budget = nsteps if last else min(nsteps, int(np.ceil(max_share*total)))
+                history = self.run(budget, att, rep, min_rate=None if last else min_rate, **kwargs)
+                histories.append((stage, history))
+                nsteps -= history['iterations']
+                if history['reason'] == 'stopped' or nsteps <= 0:
+                    break
+        finally:
+            self.stage = 'exact'
+        return histories
+
+    # ============================== #
+    #           Checkpoint           #
+    # ============================== #
+
+    def save_checkpoint(self, filepath):
+        """Save the state (polygons, centres, region, iteration, random state and run parameters).
+        See checkpoint.save_checkpoint for the file format.
+        """
+        save_checkpoint(self, filepath)
+
+    @classmethod
+    def load_checkpoint(cls, filepath, **kwargs):
+        """Create a packer from a checkpoint file (see save_checkpoint).
+        The kwargs are passed to the constructor (e.g. executor).
+        """
+        return load_checkpoint(filepath, cls(**kwargs))
+
+
+def _pair_codes(pairs, n):
+    """Encode pairs (i, j) of n objects as integers, independent of their order."""
+    return np.min(pairs, axis=1, initial=n)*n + np.max(pairs, axis=1, initial=0)
+
+
+def _reserve(buffer, size):
+    """Return the buffer with room for at least size rows.
+    If the capacity is insufficient, it is (at least) doubled, so that repeatedly
+    appending to the buffer has amortised constant cost.
+    """
+    if size <= len(buffer):
+        return buffer
+    grown = np.empty((max(size, 2*len(buffer)),)+buffer.shape[1:], dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
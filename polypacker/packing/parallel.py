@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import os
+
+import numpy as np
+
+from .collision import intersects
+
+
+class ParallelExecutor:
+    """Test candidate pairs for intersection in a pool of workers.
+    The pairs are split into chunks of a fixed size, which are tested in parallel
+    and merged back in order, so the result does not depend on the number of workers.
+    With kind='process', the vertices and centres are shared with the workers through
+    shared memory, so only the pairs are sent to them. The vertices are only shared
+    again when their version changes. With kind='thread', Shapely releases the GIL.
+    Use as a context manager or call close() to release the workers and memory.
+    """
+
+    def __init__(self, workers=None, kind='process', chunksize=4096):
+        self.workers = workers or os.cpu_count()
+        self.kind = kind
+        self.chunksize = chunksize  # pairs per task
+        if kind == 'process':
+            self._pool = ProcessPoolExecutor(self.workers)
+        elif kind == 'thread':
+            self._pool = ThreadPoolExecutor(self.workers)
+        else:
+            raise Exception("kind must be 'process' or 'thread'")
+        self._shared = {}  # name -> SharedArray
+        self._version = None  # version of the shared vertices
+
+    def intersects(self, vertices, offsets, x0y0, pairs, shapes=None, version=None):
+        """Test pairs (i, j) of polygons for intersection, see collision.intersects.
+        The version identifies the vertices and offsets, it must change whenever they do
+        and differ between callers that share the executor (see PolyPacker._version).
+        """
+        chunks = [pairs[k:k+self.chunksize] for k in range(0, len(pairs), self.chunksize)]
+        if len(chunks) < 2:  # not worth the overhead
+            return intersects(vertices, offsets, x0y0, pairs, shapes)
+        if self.kind == 'thread':
+            futures = [self._pool.submit(intersects, vertices, offsets, x0y0, chunk, shapes) for chunk in chunks]
+        else:
+            if version is None or version != self._version:
+                self._share('vertices', vertices)
+                self._share('offsets', offsets)
+                self._version = version
+            self._share('centers', x0y0)
+            names = ['vertices', 'offsets', 'centers']
+            if shapes is not None:
+                self._share('shapes', shapes)
+                names.append('shapes')
+            specs = {name: self._shared[name].spec for name in names}
+            futures = [self._pool.submit(_intersects_shared, specs, chunk) for chunk in chunks]
+        return np.concatenate([future.result() for future in futures])
+
+    def _share(self, name, array):
+        """Copy the array into shared memory (reusing the block if it fits)."""
+        shared = self._shared.get(name)
+        if shared is None or shared.shm.size < max(array.nbytes, 1) or shared.dtype != array.dtype:
+            if shared is not None:
+                shared.release(unlink=True)
+            shared = self._shared[name] = SharedArray.create(array.shape, array.dtype)
+        shared.write(array)
+
+    def close(self):
+        """Shut the workers down and release the shared memory."""
+        self._pool.shutdown()
+        for shared in self._shared.values():
+            shared.release(unlink=True)
+        self._shared = {}
+        self._version = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SharedArray:
+    """A numpy array in a (named) shared memory block."""
+
+    def __init__(self, shm, shape, dtype):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    @classmethod
+    def create(cls, shape, dtype):
+        nbytes = max(int(np.prod(shape))*np.dtype(dtype).itemsize, 1)
+        return cls(SharedMemory(create=True, size=nbytes), shape, dtype)
+
+    @classmethod
+    def attach(cls, name, shape, dtype):
+        """Attach to an existing block, which remains owned by its creator.
+        Worker processes share the resource tracker of their parent, which unlinks the block.
+        """
+        try:
+            shm = SharedMemory(name=name, track=False)  # Python >= 3.13
+        except TypeError:
+            shm = SharedMemory(name=name)
+        return cls(shm, shape, dtype)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype.str
+
+    @property
+    def array(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def write(self, array):
+        self.shape = array.shape
+        self.array[...] = array
+
+    def release(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+_attached = {}  # role (vertices, offsets, centers, shapes) -> SharedArray, per worker process
+
+
+def _intersects_shared(specs, pairs):
+    """Worker task: test pairs against the geometry in shared memory."""
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        shared = _attached.get(key)
+        if shared is None or shared.shm.name != name:
+            if shared is not None:
+                shared.release()  # stale block, the creator unlinks it
+            shared = _attached[key] = SharedArray.attach(name, shape, dtype)
+        shared.shape = tuple(shape)
+        arrays[key] = shared.array
+    return intersects(arrays['vertices'], arrays['offsets'], arrays['centers'], pairs, arrays.get('shapes'))
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+import time
+
+
+class Stats:
+    """Instrumentation of the packing steps (see PolyPacker.stats).
+    Records the wall time spent in each phase of a step, and per step the number of
+    candidate pairs (broad phase) and contacts (narrow phase), and the number of
+    moved and active polygons. The candidates are decided by one of the tiers of the
+    narrow phase: rejected by their bounding boxes ('aabb'), accepted by their inscribed
+    circles ('inscribed') or tested exactly ('exact'). Disabled, the calls return immediately.
+    Timing works by passing the previous time stamp along:
+        t = stats.tic()
+        ...  # broad phase
+        t = stats.toc('broad', t)
+        ...  # narrow phase
+        t = stats.toc('narrow', t)
+    """
+
+    PHASES = ('broad', 'narrow', 'forces', 'update')
+    COUNTS = ('candidates', 'contacts', 'moved', 'active')
+    TIERS = ('aabb', 'inscribed', 'exact')
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counting = True  # see uncounted
+        self.reset()
+
+    def reset(self):
+        """Set all timers and counters to zero."""
+        self.steps = 0
+        self.time = dict.fromkeys(self.PHASES, 0.)  # total seconds
+        self.total = dict.fromkeys(self.COUNTS+self.TIERS, 0)  # summed over all steps
+        self.last = dict.fromkeys(self.COUNTS+self.TIERS, 0)  # of the last step
+
+    def tic(self):
+        """Return the current time stamp (0 if disabled)."""
+        return time.perf_counter() if self.enabled else 0
+
+    def toc(self, phase, t0):
+        """Add the time since t0 to phase, return the current time stamp."""
+        if not self.enabled:
+            return 0
+        now = time.perf_counter()
+        self.time[phase] += now-t0
+        return now
+
+    def count(self, **counts):
+        """Record counts (see COUNTS and TIERS) of the current step."""
+        if not self.enabled or not self._counting:
+            return
+        for key, value in counts.items():
+            self.total[key] += int(value)
+            self.last[key] = int(value)
+
+    @contextmanager
+    def uncounted(self):
+        """Ignore the counts recorded within the block (e.g. of a re-test within a step).
+        The time is still recorded.
+        """
+        counting, self._counting = self._counting, False
+        try:
+            yield
+        finally:
+            self._counting = counting
+
+    def step(self):
+        """Mark the end of a step."""
+        if self.enabled:
+            self.steps += 1
+
+    @property
+    def efficiency(self):
+        """Fraction of the candidate pairs that were contacts (broad phase efficiency)."""
+        return self.total['contacts']/self.total['candidates'] if self.total['candidates'] else 1.
+
+    @property
+    def rates(self):
+        """Fraction of the candidate pairs decided by each tier (see TIERS)."""
+        decided = sum(self.total[tier] for tier in self.TIERS)
+        return {tier: self.total[tier]/decided if decided else 0. for tier in self.TIERS}
+
+    def snapshot(self):
+        """Return a copy of the current state as a (flat) dict.
+        Contains the number of steps, the total and mean time of each phase (time_<phase>,
+        mean_<phase>), the total and last counts (<count>, last_<count>), the efficiency
+        and the rate of each tier (rate_<tier>).
+        """
+        snapshot = dict(steps=self.steps, efficiency=self.efficiency)
+        for phase, seconds in self.time.items():
+            snapshot['time_'+phase] = seconds
+            snapshot['mean_'+phase] = seconds/self.steps if self.steps else 0.
+        for key in self.COUNTS+self.TIERS:
+            snapshot[key] = self.total[key]
+            snapshot['last_'+key] = self.last[key]
+        for tier, rate in self.rates.items():
+            snapshot['rate_'+tier] = rate
+        return snapshot
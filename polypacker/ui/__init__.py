@@ -1,5 +1,6 @@
 from .headless import CLI
 from .graphical import GUI
+from .threaded import Simulation, SnapshotQueue
 
 
 def uipicker(uitype):
@@ -1,21 +1,32 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import EllipseCollection
 from matplotlib.widgets import Button
 
 from .ui import UI, UI_Action, update_needed
-from ..visualize import plot_polygon, update_patch
+from ..packing.distances import maxradii
+from ..packing.geometry import as_vertices, decimate, midpoints, translated
+from ..visualize import plot_polygon, plot_collection, update_collection
 
 class GUI(UI):
+    """Show the polygons and convergence parameters in a matplotlib figure.
+    The polygons are drawn as a single collection, and only the changing artists
+    are redrawn (blitting) if the backend supports it. For many polygons, a level of
+    detail (lod) can be set to draw each polygon as its bounding 'circle' or with at
+    most lod_vertices vertices ('subsample'), when there are more than lod_above.
+    """
 
     # ============================== #
     #              INIT              #
     # ============================== #
 
-    def init(self, polygons, region=None, *, polygonscolor='tab:blue', regioncolor='tab:red', **kwargs):
+    def init(self, polygons, region=None, *, polygonscolor='tab:blue', regioncolor='tab:red',
+             lod=None, lod_above=2000, lod_vertices=8, **kwargs):
 
         # create the figure and subplots
         fig, axs = plt.subplots(ncols=3, nrows=2)
-        fig.canvas.set_window_title(kwargs.pop('window_title', ''))
+        if fig.canvas.manager is not None:
+            fig.canvas.manager.set_window_title(kwargs.pop('window_title', ''))
 
         # create one large subplot from smaller ones
         grid = axs[0, 0].get_gridspec()  # get grid from top left reference
@@ -46,12 +57,31 @@ class GUI(UI):
         axes['coll'].autoscale(axis='y')
 
         # plot region and initial polygon data
-        def plot_poly(poly, color, axis):
-            face = poly.color if hasattr(poly, 'color') else color
-            return plot_polygon(poly, axis=axis, facecolor=face)
+        if lod not in {None, 'circles', 'subsample'}:
+            raise Exception("lod must be None, 'circles' or 'subsample'")
+        self._lod = lod
+        self._lod_above = lod_above
+        self._lod_vertices = lod_vertices
         ax = axes['poly']
-        self._region = plot_poly(region, regioncolor, ax) if region is not None else None
-        self._patches = [plot_poly(p, polygonscolor, ax) for p in polygons]
+        if region is not None:
+            face = region.color if hasattr(region, 'color') else regioncolor
+            self._region = plot_polygon(region, axis=ax, facecolor=face)
+        else:
+            self._region = None
+        if isinstance(polygons, tuple):  # vertex buffer
+            colors = polygonscolor
+        else:
+            colors = [p.color if hasattr(p, 'color') else polygonscolor for p in polygons]
+        vertices, offsets = as_vertices(polygons)
+        if self._use_circles(len(offsets)-1):
+            centers, radii = self._circles(vertices, offsets)
+            self._polygons = EllipseCollection(2*radii, 2*radii, 0, units='xy', offsets=centers,
+                                               offset_transform=ax.transData, facecolors=colors)
+            ax.add_collection(self._polygons)
+            ax.update_datalim(np.vstack([centers-radii[:, np.newaxis], centers+radii[:, np.newaxis]]))
+            ax.autoscale_view()
+        else:
+            self._polygons = plot_collection(self._decimated(vertices, offsets), axis=ax, facecolors=colors)
 
         # plot line data (hidden due to nan value)
         empty_nan = np.full(self.ITER_max, np.nan)
@@ -73,6 +103,12 @@ class GUI(UI):
         self._fig = fig
         self._axes = axes
 
+        # blitting: keep a background without the changing artists, invalidated by any full draw
+        self._blit = fig.canvas.supports_blit
+        self._background = None
+        self._refreshing = False
+        fig.canvas.mpl_connect('draw_event', self._on_draw)
+
         return axes  # return the axes dict in case user wants to modify
 
     # ============================== #
@@ -91,12 +127,16 @@ class GUI(UI):
     def UPDATE(self):
         return self._UPDATE
 
-    def _do_update(self, ITER, polygons=None, density=None, collisions=None, *, wait_time=0.001):
+    def _do_update(self, ITER, polygons=None, density=None, collisions=None, *, stats=None, wait_time=0.001):
+        # stats (see PolyPacker.stats) are not shown
 
-        # polygons
+        # polygons (a list of polygons or a vertex buffer)
         if polygons is not None:
-            for patch, poly in zip(self._patches, polygons):
-                update_patch(patch, poly)
+            vertices, offsets = as_vertices(polygons)
+            if isinstance(self._polygons, EllipseCollection):
+                self._polygons.set_offsets(self._circles(vertices, offsets)[0])
+            else:
+                update_collection(self._polygons, self._decimated(vertices, offsets))
 
         # density & collisions (latter needs to update the limits dynamically)
         def update_line(i, line, new, relim_ax=None):
@@ -104,21 +144,71 @@ class GUI(UI):
                 ydat = line.get_ydata()
                 ydat[i] = new
                 line.set_ydata(ydat)
-                if relim_ax is not None:
+                if relim_ax is not None and not relim_ax.get_ylim()[0] <= new <= relim_ax.get_ylim()[1]:
                     relim_ax.relim()
                     relim_ax.autoscale_view()
+                    self._background = None  # axis changed, needs a full draw
         update_line(ITER, self._density, density)
         update_line(ITER, self._collisions, collisions, relim_ax=self._axes['coll'])
 
         # process
-        self._fig.canvas.draw()
-        self._fig.canvas.flush_events()
-        plt.draw()
-        plt.pause(wait_time)
+        canvas = self._fig.canvas
+        if self._blit:
+            if self._background is None:
+                self._refresh()
+            canvas.restore_region(self._background)
+            for artist in self._artists():
+                artist.axes.draw_artist(artist)
+            canvas.blit(self._fig.bbox)
+        else:
+            canvas.draw_idle()
+        canvas.flush_events()
+        if wait_time > 0:
+            canvas.start_event_loop(wait_time)  # unlike plt.pause, does not redraw everything
 
         # done
         self.UPDATE.reset()
 
+    def wait(self, seconds):
+        self._fig.canvas.start_event_loop(seconds)  # keep the buttons responsive
+
+    # ============================== #
+    #            Drawing             #
+    # ============================== #
+
+    def _artists(self):
+        """The artists that change with each update."""
+        return [self._polygons, self._density, self._collisions]
+
+    def _refresh(self):
+        """Draw the figure without the changing artists and keep it as the background."""
+        artists = self._artists()
+        for artist in artists:
+            artist.set_visible(False)
+        self._refreshing = True
+        self._fig.canvas.draw()
+        self._refreshing = False
+        self._background = self._fig.canvas.copy_from_bbox(self._fig.bbox)
+        for artist in artists:
+            artist.set_visible(True)
+
+    def _on_draw(self, event):
+        if not self._refreshing:
+            self._background = None  # e.g. after resizing or zooming
+
+    def _use_circles(self, N):
+        return self._lod == 'circles' and N > self._lod_above
+
+    def _circles(self, vertices, offsets):
+        """Centres and radii of the bounding circles of the polygons."""
+        centers = midpoints(vertices, offsets)
+        return centers, maxradii(translated(vertices, offsets, -centers), offsets)
+
+    def _decimated(self, vertices, offsets):
+        if self._lod == 'subsample' and len(offsets)-1 > self._lod_above:
+            return decimate(vertices, offsets, self._lod_vertices)
+        return vertices, offsets
+
 
 class GUI_ToggleButton(UI_Action):
     """ToggleButton action class for GUI.
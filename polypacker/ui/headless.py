@@ -25,7 +25,7 @@ class CLI(UI):
     def UPDATE(self):
         return None
 
-    def _do_update(self, ITER, polygons=None, density=None, collisions=None, *, header_every=20, fillchar='-'):
+    def _do_update(self, ITER, polygons=None, density=None, collisions=None, *, stats=None, header_every=20, fillchar='-'):
         # progress
         L = math.floor(math.log10(self.ITER_max))+1  # number of digits for ITER
         fmt = 'ITER: %'+str(L)+'d of %'+str(L)+'d = %5.1f%%'
@@ -43,6 +43,20 @@ class CLI(UI):
         hdr += sep.replace(' ', fillchar) + 'num_hits'.center(w, fillchar)
         fmt += sep + ('%'+str(w)+'d' if collisions else '%s')
         dat += (collisions if collisions else ' '*w,)
+        # stats (see PolyPacker.stats), mean time per step in ms and counts of the last step
+        if stats is not None:
+            w = 8
+            for phase in ('broad', 'narrow', 'forces', 'update'):
+                hdr += sep.replace(' ', fillchar) + phase.center(w, fillchar)
+                fmt += sep + '%'+str(w)+'.3f'
+                dat += (stats['mean_'+phase]*1e3,)
+            for key, name in (('candidates', 'cand'), ('contacts', 'hits'), ('moved', 'moved'), ('active', 'active')):
+                hdr += sep.replace(' ', fillchar) + name.center(w, fillchar)
+                fmt += sep + '%'+str(w)+'d'
+                dat += (stats['last_'+key],)
+            hdr += sep.replace(' ', fillchar) + 'exact%'.center(w, fillchar)  # of the candidates so far
+            fmt += sep + '%'+str(w)+'.1f'
+            dat += (stats['rate_exact']*100,)
         # print
         fmt += ' |'
         hdr += fillchar + '|'
@@ -0,0 +1,198 @@
+import multiprocessing
+import queue
+import threading
+
+import numpy as np
+
+from .ui import UI, UI_Action
+from ..packing.geometry import rotated, translated
+
+
+class Simulation:
+    """Run PolyPacker.run in a worker thread or process, decoupled from the UI.
+    The worker publishes snapshots (centres, angles and metrics) into a SnapshotQueue,
+    which keeps only the latest ones, so the packer only pays for copying the centres.
+    The UI (e.g. GUI or CLI) consumes the snapshots at its own pace in the calling
+    thread, and its STOP and UPDATE actions are sent back over a control channel.
+
+        sim = Simulation(packer, nsteps, att, rep, every=10, region=region)
+        history = sim.show(gui)
+
+    With kind='process', the packer is copied to the worker and updated with the
+    final centres (and orientations, iteration and driver) when the run has finished.
+    """
+
+    def __init__(self, packer, nsteps, att, rep, *, kind='thread', every=1, maxsize=1, **kwargs):
+        """Prepare packer.run(nsteps, att, rep, **kwargs) (see PolyPacker.run).
+        A snapshot is published every few iterations (and when UPDATE was requested).
+        At most maxsize snapshots are queued, older ones are dropped.
+        """
+        if kind == 'thread':
+            Event, Worker = threading.Event, threading.Thread
+        elif kind == 'process':
+            Event, Worker = multiprocessing.Event, multiprocessing.Process
+        else:
+            raise Exception("kind must be 'thread' or 'process'")
+        self.packer = packer
+        self.kind = kind
+        self.snapshots = SnapshotQueue(maxsize, kind)
+        self._stop = Event()  # control channel
+        self._update = Event()
+        self._results = SnapshotQueue(1, kind)  # result (or error) of the run
+        publisher = Publisher(packer, nsteps, every, self.snapshots, self._stop, self._update)
+        args = (packer, (nsteps, att, rep), kwargs, publisher, self._results)
+        self._worker = Worker(target=_simulate, args=args, daemon=True)
+        self._started = False
+        self._history = None
+
+    def start(self):
+        """Start the run in the worker."""
+        self._worker.start()
+        self._started = True
+
+    def stop(self):
+        """Request the run to stop (after the current iteration)."""
+        self._stop.set()
+
+    def request_update(self):
+        """Request a snapshot after the current iteration."""
+        self._update.set()
+
+    @property
+    def running(self):
+        return self._worker.is_alive()
+
+    def join(self):
+        """Wait for the run to finish and return its history (see PolyPacker.run)."""
+        if self._history is None:
+            result = self._results.get(timeout=None)
+            self._worker.join()
+            if isinstance(result, BaseException):
+                raise result
+            history, state = result
+            if self.kind == 'process':  # update the copy in this process
+                self.packer.centers = state['centers']
+                if self.packer.orientations:
+                    self.packer.rotate(np.arange(self.packer.N), state['orientation']-self.packer.orientation)
+                self.packer.iteration = state['iteration']
+                self.packer.driver = state['driver']
+            self._history = history
+        return self._history
+
+    def show(self, ui, interval=0.05, **kwargs):
+        """Start the run (if needed) and show its snapshots in the ui until it is done.
+        The ui is initialised with the polygons (and kwargs, e.g. the region). Waits
+        at most interval seconds for a snapshot, giving the ui time to process events.
+        Returns the history of the run.
+        """
+        vertices, offsets = (array.copy() for array in self.packer.get_vertices('local'))
+        angles = self.packer.angles.copy()
+        ui.init(self.packer.get_polygons('global'), **kwargs)
+        if not self._started:
+            self.start()
+        while True:
+            done = not self._worker.is_alive()
+            snapshot = self.snapshots.get(timeout=0)
+            if snapshot is not None:
+                xy = vertices
+                if snapshot['angles'] is not None:  # rotated since the start
+                    xy = rotated(vertices, offsets, snapshot['angles']-angles)
+                ui._do_update(snapshot['iteration'], (translated(xy, offsets, snapshot['centers']), offsets),
+                              snapshot['density'], snapshot['collisions'], **snapshot['kwargs'])
+            elif done:
+                break  # all snapshots shown
+            else:
+                ui.wait(interval)
+            if ui.was_stopped:
+                self.stop()
+            if ui.UPDATE is not None and ui.UPDATE.is_active:
+                self.request_update()
+        return self.join()
+
+
+class SnapshotQueue:
+    """A bounded queue where the latest values win: putting into a full queue
+    drops the oldest value instead of blocking the producer.
+    """
+
+    def __init__(self, maxsize=1, kind='thread'):
+        self._queue = queue.Queue(maxsize) if kind == 'thread' else multiprocessing.Queue(maxsize)
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()  # drop the oldest
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Return the oldest value (waiting at most timeout seconds), or None."""
+        try:
+            return self._queue.get(block=timeout != 0, timeout=timeout or None)
+        except queue.Empty:
+            return None
+
+
+class Publisher(UI):
+    """UI used by the worker (see Simulation), which publishes snapshots."""
+
+    def __init__(self, packer, ITER_max, ITER_upd, snapshots, stop, update):
+        super().__init__(ITER_max, ITER_upd)
+        self.packer = packer  # the worker's packer
+        self.snapshots = snapshots
+        self.published = None  # iteration of the last snapshot
+        self._STOP = EventAction(stop)
+        self._UPDATE = EventAction(update)
+
+    def init(self):
+        pass
+
+    @property
+    def STOP(self):
+        return self._STOP
+
+    @property
+    def UPDATE(self):
+        return self._UPDATE
+
+    def _do_update(self, ITER, polygons=None, density=None, collisions=None, **kwargs):
+        # the polygons follow from the centres (and angles), which is all that changes
+        angles = self.packer.angles.copy() if self.packer.orientations else None
+        self.snapshots.put(dict(iteration=ITER, centers=self.packer.centers.copy(), angles=angles,
+                                density=density, collisions=collisions, kwargs=kwargs))
+        self.published = ITER
+        self.UPDATE.reset()
+
+
+class EventAction(UI_Action):
+    """UI_Action backed by a threading or multiprocessing Event."""
+
+    def __init__(self, event):
+        self._event = event
+
+    @property
+    def is_active(self):
+        return self._event.is_set()
+
+    def reset(self):
+        self._event.clear()
+
+
+def _simulate(packer, args, kwargs, publisher, results):
+    """Run the packer in the worker and put its history and final state into results."""
+    publisher.packer = packer  # a copy, for kind='process'
+    try:
+        history = packer.run(*args, ui=publisher, **kwargs)
+        ITER = history['iterations']-1
+        if ITER >= 0 and publisher.published != ITER:  # publish the final state
+            stats = dict(stats=packer.stats.snapshot()) if packer.stats.enabled else {}
+            publisher._do_update(ITER, None, history['density'][-1], history['collisions'][-1], **stats)
+        state = dict(centers=packer.centers.copy(), orientation=packer.orientation.copy(),
+                     iteration=packer.iteration, driver=packer.driver)
+        results.put((history, state))
+    except BaseException as error:
+        results.put(error)
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import time
 
 
 class UI(ABC):
@@ -58,6 +59,10 @@ class UI(ABC):
     def _do_update(self, ITER, polygons, density, collisions, **kwargs):
         pass
 
+    def wait(self, seconds):
+        """Wait while idle (e.g. for the next snapshot, see threaded.Simulation)."""
+        time.sleep(seconds)
+
 
 class UI_Action(ABC):
 
@@ -1 +1 @@
-from .plotting import plot_polygon, plot_polygons, update_patch
+from .plotting import plot_polygon, plot_polygons, update_patch, plot_collection, update_collection
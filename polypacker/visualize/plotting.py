@@ -1,4 +1,8 @@
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
+
+from ..packing.geometry import as_vertices, split
 
 
 def plot_polygon(polygon, axis=None, **kwargs):
@@ -23,3 +27,32 @@ def update_patch(patch, polygon):
     xy = list(map(list, zip(*polygon.exterior.xy)))  # transpose
     patch.set_xy(xy)
     return patch
+
+
+def plot_collection(polygons, axis=None, **kwargs):
+    """Plot polygons as a single PolyCollection, which draws much faster than
+    one patch per polygon. The polygons are a list of shapely.geometry.Polygon
+    objects or a vertex buffer (vertices, offsets), see packing.geometry.ragged.
+    Use kwargs to pass any instruction valid for matplotlib.collections.PolyCollection.
+    """
+    ax = axis if axis is not None else plt.gca()
+    collection = PolyCollection(as_verts(*as_vertices(polygons)), **kwargs)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+
+def update_collection(collection, polygons):
+    """Update a PolyCollection with new polygons (see plot_collection)."""
+    collection.set_verts(as_verts(*as_vertices(polygons)))
+    return collection
+
+
+def as_verts(vertices, offsets):
+    """Convert a vertex buffer to the verts of a PolyCollection.
+    If all polygons have the same number of vertices, this is a (N, n, 2) view.
+    """
+    counts = np.diff(offsets)
+    if len(counts) and np.all(counts == counts[0]):
+        return vertices.reshape((len(counts), counts[0], 2))
+    return split(vertices, offsets)